@@ -1,17 +1,54 @@
 import os
-import requests
 import json
 from datetime import datetime, timedelta
 from flask import Flask, request, jsonify, render_template as original_render_template, redirect, session, g
-import smtplib
-from email.message import EmailMessage
+import click
 import re
-import shutil
-from werkzeug.security import generate_password_hash, check_password_hash
+import io
+import csv
+import gzip
+import threading
+import queue
+import atexit
+import functools
+from contextlib import contextmanager
+from time import monotonic, sleep, time as wall_clock
+from scheduler import Scheduler, every, daily
+from cluster import NamespacedStorage, open_storage, parse_nodes, node_for
+from profiling import RequestProfiler, ProfilingMiddleware
+from werkzeug.exceptions import HTTPException
+
+# requests, smtplib, email, shutil ו-werkzeug.security נטענים בתוך הפונקציות שמשתמשות בהם
+# (נדירים ויקרים לטעינה) - ראו bench_startup.py לתקציב זמן העלייה.
+
+try:
+    import orjson  # אופציונלי - קידוד JSON מהיר
+except ImportError:
+    orjson = None
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "default_secret")
 
+# מאחורי reverse proxy: מספר ה-proxies שמוסיפים X-Forwarded-For, כדי ש-remote_addr יהיה כתובת הלקוח
+# (מגבלת ההחזקות לכתובת). 0 = חיבור ישיר
+PROXY_HOPS = int(os.getenv("PROXY_HOPS", 0))
+if PROXY_HOPS:
+    from werkzeug.middleware.proxy_fix import ProxyFix
+
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS, x_proto=PROXY_HOPS)
+
+# --- אחסון ---
+# STORAGE_URL ריק = קבצים מקומיים. להרצה על כמה שרתים: sqlite:///path/shared.db או redis://host:6379/0
+# (ראו cluster.py). כל הקריאות והכתיבות של הנתונים עוברות דרך load_json/save_json/read_json.
+storage = open_storage(os.getenv("STORAGE_URL", ""),
+                       poll_seconds=float(os.getenv("STORAGE_POLL_SECONDS", 0.5)))
+
+# כמה עסקים על אותו אחסון: כל מופע מגיש עסק אחד (BUSINESS_CODE), והמסמכים והנעילות שלו
+# נשמרים תחת "<business_code>/". ריק = עסק יחיד בשורש האחסון, כמו קודם.
+BUSINESS_CODE = os.getenv("BUSINESS_CODE", "")
+if BUSINESS_CODE:
+    storage = NamespacedStorage(storage, BUSINESS_CODE)
+
 # --- קבצים ---
 WEEKLY_SCHEDULE_FILE = "weekly_schedule.json"
 OVERRIDES_FILE = "overrides.json"
@@ -29,36 +66,344 @@ services_prices = {
 # --- פונקציות עזר ---
 
 def load_json(filename):
-    if not os.path.exists(filename):
-        return {}
-    with open(filename, "r", encoding="utf-8") as f:
-        return json.load(f)
+    text = storage.get(filename)
+    return json.loads(text) if text else {}
+
+_read_cache = {}
+
+def read_json(filename, transform=None):
+    """קריאה בלבד: תוצאה משותפת במטמון לפי גרסת המסמך באחסון - אסור לשנות אותה.
+    transform (אופציונלי) מחושב פעם אחת לכל גרסה של הקובץ, למשל המרה למסכות"""
+    key = storage.version(filename)
+    if key is None:
+        return transform({}) if transform else {}
+    entry = _read_cache.get((filename, transform))
+    if entry is None or entry[0] != key:
+        data = load_json(filename)
+        entry = (key, transform(data) if transform else data)
+        _read_cache[(filename, transform)] = entry
+    return entry[1]
 
 def save_json(filename, data):
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    # כתיבה אטומית (קובץ זמני והחלפה / טרנזקציה) - worker שנהרג באמצע לא משאיר JSON חצוי
+    storage.put(filename, json.dumps(data, indent=2, ensure_ascii=False))
 
 def load_text(filename):
-    if not os.path.exists(filename):
-        return ""
-    with open(filename, "r", encoding="utf-8") as f:
-        return f.read()
+    return storage.get(filename) or ""
 
 def save_text(filename, content):
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(content.strip())
+    storage.put(filename, content.strip())
+
+def dumps_compact(data):
+    """JSON קומפקטי כ-bytes (orjson אם זמין)"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def json_response(data, status=200):
+    return app.response_class(dumps_compact(data), status=status, mimetype="application/json")
+
+# --- נעילת כתיבה ---
+# כל load→שינוי→save של תורים, overrides, שגרה שבועית, צוות ורישום העסקים רץ תחת אותה נעילה,
+# גם בין workers ושרתים (storage.lock). אחרי הנעילה sync() - קוראים את הכתיבות של אחרים לפני השינוי.
+
+_booking_lock = threading.Lock()
+_lock_state = threading.local()
+
+@contextmanager
+def booking_lock():
+    if getattr(_lock_state, "held", False):
+        yield  # כבר בתוך הנעילה (למשל פונקציה נעולה שקוראת לפונקציה נעולה)
+        return
+    with _booking_lock, storage.lock("booking"):
+        _lock_state.held = True
+        try:
+            storage.sync()
+            yield
+        finally:
+            _lock_state.held = False
+
+def locked_write(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with booking_lock():
+            return view(*args, **kwargs)
+    return wrapper
 
 def load_appointments():
     return load_json(APPOINTMENTS_FILE)
 
 def save_appointments(data):
     save_json(APPOINTMENTS_FILE, data)
-
-def load_one_time_changes():
-    return load_json(ONE_TIME_FILE)
-
-def save_one_time_changes(data):
-    save_json(ONE_TIME_FILE, data)
+    bump_availability_version()
+
+# --- צוות (כיסאות) ---
+# לכל איש צוות שגרה שבועית ו-overrides משלו. איש הצוות הראשי (DEFAULT_STAFF_ID) משתמש
+# בקבצים שבשורש, כך שעסק עם ספר אחד עובד בדיוק כמו קודם; השאר תחת staff/<id>/.
+# סדר הרשימה ב-staff.json הוא סדר העדיפות בהקצאת תורים.
+
+STAFF_FILE = "staff.json"
+STAFF_ROOT = "staff"
+DEFAULT_STAFF_ID = "main"
+
+def staff_file(staff_id, filename):
+    if staff_id == DEFAULT_STAFF_ID:
+        return filename
+    return os.path.join(STAFF_ROOT, staff_id, filename)
+
+def load_staff():
+    staff = read_json(STAFF_FILE).get("staff") or []
+    if not any(member["id"] == DEFAULT_STAFF_ID for member in staff):
+        staff = [{"id": DEFAULT_STAFF_ID, "name": ""}] + staff
+    return staff
+
+def save_staff(staff):
+    save_json(STAFF_FILE, {"staff": staff})
+    bump_availability_version()
+
+def staff_ids():
+    return [member["id"] for member in load_staff()]
+
+def request_staff_id(data=None):
+    """staff_id מגוף הבקשה או מה-query (ברירת מחדל: הראשי), או None אם אין כזה"""
+    staff_id = (data or {}).get("staff_id") or request.args.get("staff_id") or DEFAULT_STAFF_ID
+    return staff_id if staff_id in staff_ids() else None
+
+def create_staff_files(staff_id):
+    save_json(staff_file(staff_id, WEEKLY_SCHEDULE_FILE), {str(i): [] for i in range(7)})
+    save_json(staff_file(staff_id, OVERRIDES_FILE), {})
+
+def load_weekly_schedule(staff_id=DEFAULT_STAFF_ID):
+    return load_json(staff_file(staff_id, WEEKLY_SCHEDULE_FILE))
+
+def save_weekly_schedule(data, staff_id=DEFAULT_STAFF_ID):
+    save_json(staff_file(staff_id, WEEKLY_SCHEDULE_FILE), data)
+    bump_availability_version()
+
+# --- גרסת זמינות ומטמון דף ציבורי ---
+# כל כתיבה שמשנה זמינות (הזמנה, ביטול, overrides, שגרה שבועית) מעלה את הגרסה,
+# והדף הציבורי נשמר במטמון לפי (עסק, גרסה, תאריך היום).
+
+DEFAULT_BUSINESS_CODE = BUSINESS_CODE or "default"  # העסק שהמופע מגיש
+PAGE_CACHE_GZIP = os.getenv("PAGE_CACHE_GZIP", "1") == "1"
+
+_availability_versions = {}
+_availability_lock = threading.Lock()
+_page_cache = {}  # business_code -> (version, date, body, is_gzip)
+
+def availability_stamp(business_code=DEFAULT_BUSINESS_CODE):
+    """חותמת השינוי של הקבצים באחסון - זהה בכל ה-workers והשרתים, ולכן גם בסיס ה-ETag"""
+    paths = [APPOINTMENTS_FILE, OVERRIDES_FILE, WEEKLY_SCHEDULE_FILE, STAFF_FILE, HOLDS_FILE]
+    for sid in staff_ids():
+        if sid != DEFAULT_STAFF_ID:
+            paths += [staff_file(sid, WEEKLY_SCHEDULE_FILE), staff_file(sid, OVERRIDES_FILE)]
+    # החזקה שפג תוקפה משחררת שעה בלי כתיבה - הפקיעה הקרובה היא חלק מהחותמת, כך שאחריה
+    # החותמת משתנה (ETag חדש, המטמון נבנה מחדש וזרמי SSE שולחים snapshot)
+    next_expiry = slot_holds.next_expiry(business_code)
+    return f"{storage.stamp(paths)}.{next_expiry or 0:.3f}"
+
+def get_availability_version(business_code=DEFAULT_BUSINESS_CODE, stamp=None):
+    # מונה מקומי (ביטול מיידי של מטמון התהליך) + חותמת האחסון (כתיבה מ-worker או משרת אחר)
+    if stamp is None:
+        stamp = availability_stamp(business_code)
+    return f"{_availability_versions.get(business_code, 0)}.{stamp}"
+
+def bump_availability_version(business_code=DEFAULT_BUSINESS_CODE):
+    with _availability_lock:
+        _availability_versions[business_code] = _availability_versions.get(business_code, 0) + 1
+        _page_cache.pop(business_code, None)
+
+def get_cached_page(business_code, version, date):
+    entry = _page_cache.get(business_code)
+    if entry and entry[0] == version and entry[1] == date:
+        return entry[2], entry[3]
+    return None
+
+def store_cached_page(business_code, version, date, html):
+    body = html.encode("utf-8")
+    if PAGE_CACHE_GZIP:
+        body = gzip.compress(body, compresslevel=6)
+    with _availability_lock:
+        # כתיבה במקביל עלולה להקדים אותנו - לא שומרים גרסה ישנה
+        if get_availability_version(business_code) == version:
+            _page_cache[business_code] = (version, date, body, PAGE_CACHE_GZIP)
+    return body, PAGE_CACHE_GZIP
+
+# --- החזקות זמניות של שעות (holds) ---
+# לקוח מחזיק שעה בזמן מילוי הטופס; שעה מוחזקת לא זמינה לאחרים עד /book או עד פקיעת TTL.
+# נשמרות באחסון (slot_holds.json), כך שכל ה-workers והשרתים רואים אותן. הפקיעה בשעון קיר
+# (משותף לתהליכים); החזקות שפג תוקפן מסוננות בקריאה ומנוקות בכתיבה הבאה.
+
+HOLDS_FILE = "slot_holds.json"
+HOLD_TTL_SECONDS = int(os.getenv("HOLD_TTL_SECONDS", 300))
+# /hold אנונימי: סקריפט בלי cookie יכול להחזיק את כל השעות ולחדש אותן לפני הפקיעה - מגבילים לכתובת
+HOLD_MAX_PER_CLIENT = int(os.getenv("HOLD_MAX_PER_CLIENT", 3))
+
+class SlotHolds:
+    """עם כמה כיסאות, אותה שעה יכולה להיות מוחזקת עד מספר אנשי הצוות הפנויים בה.
+    מבנה המסמך: {business_code: {date: {time: {hold_id: {"expires": ..., "client": כתובת הלקוח}}}}}"""
+
+    def __init__(self, filename=HOLDS_FILE, clock=wall_clock):
+        self.filename = filename
+        self.clock = clock
+
+    def _live(self, business_code):
+        """(date, time, {hold_id: hold}) של החזקות פעילות - קריאה בלבד, דרך read_json"""
+        now = self.clock()
+        for date, times in read_json(self.filename).get(business_code, {}).items():
+            for time, by_id in times.items():
+                live = {h: hold for h, hold in by_id.items() if hold["expires"] > now}
+                if live:
+                    yield date, time, live
+
+    def _load(self, business_code):
+        """לכתיבה (תחת booking_lock): המסמך המלא, וההחזקות של העסק בלי אלה שפג תוקפן"""
+        data = load_json(self.filename)
+        now = self.clock()
+        holds = {}
+        for date, times in data.get(business_code, {}).items():
+            for time, by_id in times.items():
+                live = {h: hold for h, hold in by_id.items() if hold["expires"] > now}
+                if live:
+                    holds.setdefault(date, {})[time] = live
+        data[business_code] = holds
+        return data, holds
+
+    def acquire(self, business_code, date, time, capacity=1, client=None, ttl=HOLD_TTL_SECONDS):
+        """מחזיר hold_id, או None אם כל הכיסאות בשעה הזו כבר מוחזקים"""
+        with booking_lock():
+            data, holds = self._load(business_code)
+            by_id = holds.setdefault(date, {}).setdefault(time, {})
+            if len(by_id) >= capacity:
+                return None
+            hold_id = os.urandom(12).hex()
+            by_id[hold_id] = {"expires": self.clock() + ttl, "client": client}
+            save_json(self.filename, data)
+            return hold_id
+
+    def release(self, business_code, hold_id):
+        """מחזיר (date, time) של ההחזקה ששוחררה, או None"""
+        with booking_lock():
+            data, holds = self._load(business_code)
+            for date, times in holds.items():
+                for time, by_id in times.items():
+                    if by_id.pop(hold_id, None) is not None:
+                        if not by_id:
+                            del times[time]
+                        save_json(self.filename, data)
+                        return date, time
+        return None
+
+    def holders(self, business_code, date, time):
+        return {h for d, t, by_id in self._live(business_code) if (d, t) == (date, time) for h in by_id}
+
+    def held_counts(self, business_code, exclude_hold=None):
+        """{date: {time: count}} של החזקות פעילות, בלי ההחזקה של המבקש עצמו"""
+        held = {}
+        for date, time, by_id in self._live(business_code):
+            count = len(by_id) - (exclude_hold in by_id)
+            if count:
+                held.setdefault(date, {})[time] = count
+        return held
+
+    def next_expiry(self, business_code):
+        return min((hold["expires"] for _, _, by_id in self._live(business_code) for hold in by_id.values()),
+                   default=None)
+
+    def client_count(self, business_code, client):
+        """כמה החזקות פעילות יש לכתובת הזו"""
+        return sum(1 for _, _, by_id in self._live(business_code) for hold in by_id.values()
+                   if hold["client"] == client)
+
+slot_holds = SlotHolds()
+
+# --- שינויים חד פעמיים (overrides) ---
+# מקור אמת יחיד לשינויים לפי תאריך: {"YYYY-MM-DD": {"add": [...], "remove": [...], "edit": [{"from", "to"}]}}
+# one_time_changes.json הישן ממוזג לכאן פעם אחת בעלייה (create_app) ונמחק.
+
+def load_overrides(staff_id=DEFAULT_STAFF_ID):
+    return load_json(staff_file(staff_id, OVERRIDES_FILE))
+
+def read_overrides(staff_id=DEFAULT_STAFF_ID):
+    """כמו load_overrides אבל לקריאה בלבד (מטמון משותף)"""
+    return read_json(staff_file(staff_id, OVERRIDES_FILE))
+
+def migrate_one_time_changes():
+    if not storage.exists(ONE_TIME_FILE):
+        return
+    overrides = load_overrides()
+    merge_one_time_changes(overrides, load_json(ONE_TIME_FILE))
+    save_overrides(overrides)
+    storage.delete(ONE_TIME_FILE)
+
+def save_overrides(overrides, staff_id=DEFAULT_STAFF_ID):
+    save_json(staff_file(staff_id, OVERRIDES_FILE), overrides)
+    bump_availability_version()
+
+def merge_one_time_changes(overrides, one_time):
+    """ממזג את הפורמט הישן {date: [{"time", "available"}]} לתוך overrides"""
+    for date, slots in one_time.items():
+        day = get_day_override(overrides, date)
+        for slot in slots:
+            if slot.get("available", True):
+                override_add_time(day, slot["time"])
+            else:
+                override_remove_time(day, slot["time"])
+        prune_day_override(overrides, date)
+    return overrides
+
+def get_day_override(overrides, date):
+    day = overrides.setdefault(date, {})
+    day.setdefault("add", [])
+    day.setdefault("remove", [])
+    return day
+
+def is_day_disabled(day):
+    return "__all__" in day.get("remove", [])
+
+def override_add_time(day, time):
+    if time not in day["add"]:
+        day["add"].append(time)
+    if time in day["remove"]:
+        day["remove"].remove(time)
+
+def override_remove_time(day, time):
+    if time not in day["remove"]:
+        day["remove"].append(time)
+    if time in day["add"]:
+        day["add"].remove(time)
+    if "edit" in day:
+        day["edit"] = [e for e in day["edit"] if e.get("from") != time and e.get("to") != time]
+        if not day["edit"]:
+            day.pop("edit")
+
+def override_edit_time(day, time, new_time):
+    edits = [e for e in day.get("edit", []) if e.get("from") != time]
+    edits.append({"from": time, "to": new_time})
+    day["edit"] = edits
+    if time not in day["remove"]:
+        day["remove"].append(time)
+    if new_time not in day["add"]:
+        day["add"].append(new_time)
+
+def override_revert_time(day, time):
+    if time in day.get("add", []):
+        day["add"].remove(time)
+    if time in day.get("remove", []):
+        day["remove"].remove(time)
+    if "edit" in day:
+        day["edit"] = [e for e in day["edit"] if e.get("to") != time and e.get("from") != time]
+        if not day["edit"]:
+            day.pop("edit")
+
+def overrides_delta(overrides, *dates):
+    """רק התאריכים שהשתנו - None מסמן תאריך שנמחק"""
+    return {d: overrides.get(d) for d in dates}
+
+def prune_day_override(overrides, date):
+    day = overrides.get(date)
+    if day is not None and not day.get("add") and not day.get("remove") and not day.get("edit") and not day.get("booked"):
+        overrides.pop(date)
 
 # --- נתיב קבצים של עסקים ---
 
@@ -66,10 +411,17 @@ DATA_ROOT = "data"
 BUSINESSES_ROOT = os.path.join(DATA_ROOT, "businesses")
 REGISTRY_FILE = os.path.join(BUSINESSES_ROOT, "businesses.json")
 
+_dirs_ready = False
+
 def ensure_dirs():
+    # נבדק פעם אחת בעלייה (create_app) ולא בכל בקשה
+    global _dirs_ready
+    if _dirs_ready:
+        return
     os.makedirs(BUSINESSES_ROOT, exist_ok=True)
-    if not os.path.exists(REGISTRY_FILE):
+    if not storage.exists(REGISTRY_FILE):
         save_json(REGISTRY_FILE, {"businesses": []})
+    _dirs_ready = True
 
 def load_businesses():
     ensure_dirs()
@@ -116,6 +468,8 @@ def create_business_files(business_name):
         "bot_knowledge.json"
     ]
 
+    import shutil
+
     for file_name in files:
         source_path = file_name  # קובץ קיים בשורש
         dest_path = os.path.join(business_path, file_name)
@@ -132,92 +486,195 @@ def create_business_files(business_name):
 
 # --- שעות תפוסות ושבועי ---
 
-def get_booked_times(appointments):
+def staff_booked_masks(appointments):
+    """{staff_id: {date: mask}} - תור בלי staff שייך לאיש הצוות הראשי"""
     booked = {}
     for date, apps_list in appointments.items():
-        times = []
-        for app in apps_list:
-            time = app.get('time')
-            if time:
-                times.append(time)
-        booked[date] = times
+        for appt in apps_list:
+            minute = minute_of(appt.get('time'))
+            if minute is not None:
+                staff_booked = booked.setdefault(appt.get('staff', DEFAULT_STAFF_ID), {})
+                staff_booked[date] = staff_booked.get(date, 0) | 1 << minute
     return booked
 
-def get_source(t, scheduled, added, removed, edits, disabled_day, booked_times):
-    if t in booked_times:
-        return "booked"          
-    for edit in edits:
-        if t == edit['to']:
-            return "edited"      
-    if t in added and t not in scheduled:
-        return "added"           
-    if t in scheduled and (t in removed or disabled_day):
-        return "disabled"        
-    return "base"                
-
-def generate_week_slots(with_sources=False):
-    weekly_schedule = load_json(WEEKLY_SCHEDULE_FILE)
-    overrides = load_json(OVERRIDES_FILE)
-    appointments = load_appointments()
-    bookings = get_booked_times(appointments)
+def weekly_masks(weekly_schedule):
+    return {key: times_to_mask(times) for key, times in weekly_schedule.items()}
+
+# --- ייצוג שעות כדקה ביום ו-bitsets ---
+# בתוך חישוב הזמינות שעה היא דקה ביום (0-1439) ויום הוא int שבו ביט m דלוק אם השעה קיימת,
+# כך שהוספה/הסרה/עריכה/תפוסות הן פעולות ביטים. "HH:MM" נשאר רק בקבצים ובגבול ה-API.
+
+MINUTES_PER_DAY = 24 * 60
+MINUTE_LABELS = [f"{m // 60:02d}:{m % 60:02d}" for m in range(MINUTES_PER_DAY)]
+_LABEL_TO_MINUTE = {label: m for m, label in enumerate(MINUTE_LABELS)}
+
+def minute_of(time):
+    """'HH:MM' -> דקה ביום, או None אם השעה לא תקינה"""
+    minute = _LABEL_TO_MINUTE.get(time)
+    if minute is None and isinstance(time, str) and ":" in time:
+        # פורמט לא מרופד כמו "9:00"
+        try:
+            hours, minutes = (int(x) for x in time.split(":"))
+        except ValueError:
+            return None
+        if 0 <= hours < 24 and 0 <= minutes < 60:
+            minute = hours * 60 + minutes
+    return minute
+
+def times_to_mask(times):
+    mask = 0
+    for t in times:
+        minute = minute_of(t)
+        if minute is not None:
+            mask |= 1 << minute
+    return mask
+
+def iter_minutes(mask):
+    """הביטים הדלוקים בסדר עולה"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def mask_to_times(mask):
+    return [MINUTE_LABELS[m] for m in iter_minutes(mask)]
+
+SLOT_SOURCES = ("booked", "held", "edited", "added", "disabled", "base")
+
+class DaySlots:
+    """זמינות של יום אחד: present/available ומסכה לכל מקור (booked, held, edited, ...).
+    ביום משולב של כמה אנשי צוות, staff הוא [(staff_id, DaySlots)] ו-all_free הוא החיתוך"""
+    __slots__ = ("present", "available", "sources", "staff", "all_free")
+
+    def __init__(self, present, available, sources, staff=(), all_free=0):
+        self.present = present
+        self.available = available
+        self.sources = sources
+        self.staff = staff
+        self.all_free = all_free
+
+    def __iter__(self):
+        return iter_minutes(self.present)
+
+    def is_available(self, minute):
+        return minute is not None and bool(self.available >> minute & 1)
+
+    def source(self, minute):
+        for name, mask in self.sources.items():
+            if mask >> minute & 1:
+                return name
+        return None
+
+    def free_staff(self, minute):
+        """אנשי הצוות הפנויים בדקה הזו, לפי סדר העדיפות (בלי להתחשב בהחזקות)"""
+        if minute is None:
+            return []
+        return [staff_id for staff_id, day in self.staff if day.available >> minute & 1]
+
+    def for_staff(self, staff_id):
+        return next((day for sid, day in self.staff if sid == staff_id), None)
+
+def index_day_slots(scheduled, override, booked):
+    """יום של איש צוות אחד. scheduled/booked הן מסכות; override בפורמט הקובץ"""
+    removed_times = override.get("remove", [])
+    edits = override.get("edit", [])
+    added = times_to_mask(override.get("add", []))
+    removed = times_to_mask(removed_times)
+    disabled_day = "__all__" in removed_times
+    edited_to = times_to_mask(e["to"] for e in edits)
+    edited_from = times_to_mask(e["from"] for e in edits) & ~edited_to
+
+    present = (scheduled | added | edited_to) & ~edited_from
+    booked &= present
+    edited = present & edited_to & ~booked
+    rest = present & ~booked & ~edited
+    open_rest = 0 if disabled_day else rest & ~removed
+    added_only = rest & added & ~scheduled
+
+    return DaySlots(present, edited | open_rest, {
+        "booked": booked,
+        "edited": edited,
+        "added": added_only,
+        "disabled": rest & ~open_rest & ~added_only,
+        "base": open_rest & ~added_only,
+    })
+
+def combine_staff_slots(staff_slots, held_counts):
+    """איחוד: שעה זמינה אם יש איש צוות פנוי שלא מוחזק. חיתוך (all_free): כולם פנויים.
+    המקור של כל דקה נלקח מאיש הצוות הראשון שפנוי בה, ואם אין - מהראשון שיש לו אותה"""
+    present = available = 0
+    all_free = -1 if staff_slots else 0
+    for _, day in staff_slots:
+        present |= day.present
+        available |= day.available
+        all_free &= day.available
+
+    held = 0
+    for time, count in held_counts.items():
+        minute = minute_of(time)
+        if minute is not None and available >> minute & 1:
+            free = sum(1 for _, day in staff_slots if day.available >> minute & 1)
+            if free <= count:
+                held |= 1 << minute
+    if len(staff_slots) == 1 and not held:
+        day = staff_slots[0][1]
+        return DaySlots(day.present, day.available, day.sources, staff_slots, day.available)
+
+    sources = dict.fromkeys(SLOT_SOURCES, 0)
+    sources["held"] = held
+    claimed = held
+    for pick in ("available", "present"):
+        for _, day in staff_slots:
+            take = getattr(day, pick) & ~claimed
+            for name, mask in day.sources.items():
+                sources[name] |= mask & take
+            claimed |= take
+    return DaySlots(present, available & ~held, sources, staff_slots, all_free & ~held)
+
+def build_slot_index(days=7, exclude_hold=None):
+    """אינדקס זמינות לשבוע: {date: DaySlots} משולב לכל הצוות. קריאות דרך read_json,
+    כך שקובץ שלא השתנה לא נטען ולא מומר שוב"""
+    staff = [member["id"] for member in load_staff()]
+    schedules = [(sid, read_json(staff_file(sid, WEEKLY_SCHEDULE_FILE), weekly_masks), read_overrides(sid))
+                 for sid in staff]
+    booked = read_json(APPOINTMENTS_FILE, staff_booked_masks)
+    held = slot_holds.held_counts(DEFAULT_BUSINESS_CODE, exclude_hold=exclude_hold)
     today = datetime.today()
-    week_slots = {}
-    heb_days = ["שני", "שלישי", "רביעי", "חמישי", "שישי", "שבת", "ראשון"]
+    index = {}
 
-    for i in range(7):
+    for i in range(days):
         current_date = today + timedelta(days=i)
         date_str = current_date.strftime("%Y-%m-%d")
-        weekday = current_date.weekday()
-        day_name = heb_days[weekday]
-
-        day_key = str(weekday)
-        scheduled = weekly_schedule.get(day_key, [])
-        override = overrides.get(date_str, {"add": [], "remove": [], "edit": []})
-        added = override.get("add", [])
-        removed = override.get("remove", [])
-        edits = override.get("edit", [])
-        disabled_day = removed == ["__all__"]
-
-        booked_times = bookings.get(date_str, [])
-
-        edited_to_times = [edit['to'] for edit in edits]
-        edited_from_times = [edit['from'] for edit in edits]
+        day_key = str(current_date.weekday())
+        staff_slots = [
+            (sid, index_day_slots(masks.get(day_key, 0), overrides.get(date_str, {}),
+                                  booked.get(sid, {}).get(date_str, 0)))
+            for sid, masks, overrides in schedules
+        ]
+        index[date_str] = combine_staff_slots(staff_slots, held.get(date_str, {}))
 
-        all_times = sorted(set(scheduled + added + edited_to_times))
+    return index
 
-        final_times = []
-        for t in all_times:
-            if t in edited_to_times:
-                if with_sources:
-                    final_times.append({"time": t, "available": True, "source": "edited"})
-                else:
-                    final_times.append({"time": t, "available": True})
-                continue
-            if t in edited_from_times:
-                continue
-
-            available = not (disabled_day or t in removed or t in booked_times)
-            if with_sources:
-                source = get_source(t, scheduled, added, removed, edits, disabled_day, booked_times)
-                final_times.append({"time": t, "available": available, "source": source})
-            else:
-                if available:
-                    final_times.append({"time": t, "available": True})
+def generate_week_slots(with_sources=False, exclude_hold=None, staff_id=None):
+    """staff_id: הזמינות והמקורות של איש צוות אחד (עריכת overrides שלו) במקום השילוב של כל הצוות"""
+    week_slots = {}
+    heb_days = ["שני", "שלישי", "רביעי", "חמישי", "שישי", "שבת", "ראשון"]
 
+    for date_str, day in build_slot_index(exclude_hold=exclude_hold).items():
+        day_name = heb_days[datetime.strptime(date_str, "%Y-%m-%d").weekday()]
+        if staff_id is not None:
+            day = day.for_staff(staff_id)
+        if with_sources:
+            final_times = [{"time": MINUTE_LABELS[m], "available": day.is_available(m), "source": day.source(m),
+                            "free_staff": day.free_staff(m) if staff_id is None
+                                          else [staff_id] * day.is_available(m)}
+                           for m in day]
+        else:
+            final_times = [{"time": t, "available": True} for t in mask_to_times(day.available)]
         week_slots[date_str] = {"day_name": day_name, "times": final_times}
 
     return week_slots
 
-def is_slot_available(date, time):
-    week_slots = generate_week_slots()
-    day_info = week_slots.get(date)
-    if not day_info:
-        return False
-    for t in day_info["times"]:
-        if t["time"] == time and t.get("available", True):
-            return True
-    return False
-
 # --- לפני כל בקשה ---
 
 @app.before_request
@@ -226,6 +683,53 @@ def before_request():
     g.is_admin = session.get('is_admin')
     g.is_host = session.get('is_host')
 
+# --- דחיסת תגובות ---
+
+COMPRESS_MIN_SIZE = 512
+COMPRESSIBLE_MIMETYPES = ("application/json", "text/html", "text/plain")
+
+_brotli = None
+
+def get_brotli():
+    """brotli אופציונלי - נטען בדחיסה הראשונה, None אם לא מותקן"""
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = False
+    return _brotli or None
+
+@app.after_request
+def compress_response(response):
+    if (response.direct_passthrough
+            or response.is_streamed
+            or not 200 <= response.status_code < 300
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    brotli = get_brotli()
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    encoding = request.accept_encodings.best_match(offered)
+    if not encoding:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    if encoding == "br":
+        data = brotli.compress(data, quality=4)
+    else:
+        data = gzip.compress(data, compresslevel=6)
+
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
 def render_template(template_name_or_list, **context):
     context['session'] = {
         'username': g.get('username'),
@@ -254,6 +758,8 @@ def login():
             return redirect('/host_command')
 
         # בדיקה של עסק רגיל
+        from werkzeug.security import check_password_hash
+
         businesses = load_businesses()
         for b in businesses:
             if b['username'] == username and check_password_hash(b['password_hash'], password):
@@ -283,6 +789,7 @@ def host_command():
     return render_template('host_command.html', businesses=businesses)
 
 @app.route('/add_business', methods=['POST'])
+@locked_write
 def add_business():
     if not session.get('is_host'):
         return redirect('/login')
@@ -328,6 +835,8 @@ def add_business():
                                error=f"שגיאה ביצירת קבצי העסק: {e}")
 
     # הוספה לרשומת העסקים (סיסמה בהאש)
+    from werkzeug.security import generate_password_hash
+
     businesses.append({
         "business_code": business_code,
         "business_name": business_name,
@@ -344,6 +853,7 @@ def add_business():
                            msg=f"העסק '{business_name}' נוצר בהצלחה")
 
 @app.route('/delete_business', methods=['POST'])
+@locked_write
 def delete_business():
     if not session.get('is_host'):
         return redirect('/login')
@@ -366,6 +876,7 @@ def delete_business():
         bcode = entry.get("business_code")
         bpath = os.path.join(BUSINESSES_ROOT, bcode)
         if os.path.isdir(bpath):
+            import shutil
             shutil.rmtree(bpath)
     except Exception as e:
         # אם המחיקה נכשלה, נציג אזהרה אבל נשאיר את המחיקה מהרישום
@@ -392,9 +903,11 @@ def admin_routine():
     if not session.get("is_admin"):
         return redirect("/login")
 
-    weekly_schedule = load_json(WEEKLY_SCHEDULE_FILE)
+    staff_id = request_staff_id() or DEFAULT_STAFF_ID
+    weekly_schedule = load_weekly_schedule(staff_id)
 
-    return render_template("admin_routine.html", weekly_schedule=weekly_schedule)
+    return render_template("admin_routine.html", weekly_schedule=weekly_schedule,
+                           staff=load_staff(), staff_id=staff_id)
 
                           
 @app.route("/admin_overrides")
@@ -402,8 +915,9 @@ def admin_overrides():
     if not session.get("is_admin"):
         return redirect("/login")
 
-    weekly_schedule = load_json(WEEKLY_SCHEDULE_FILE)
-    overrides = load_json(OVERRIDES_FILE)
+    staff_id = request_staff_id() or DEFAULT_STAFF_ID
+    weekly_schedule = load_weekly_schedule(staff_id)
+    overrides = load_overrides(staff_id)
 
     today = datetime.today()
     week_dates = [(today + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(7)]
@@ -415,14 +929,16 @@ def admin_overrides():
         day_name = hebrew_day_names[d.weekday()]
         date_map[d_str] = f"{d.strftime('%-d.%m')} ({day_name})"
 
-    week_slots = generate_week_slots(with_sources=True)
+    week_slots = generate_week_slots(with_sources=True, staff_id=staff_id)
 
     return render_template("admin_overrides.html",
                            overrides=overrides,
                            base_schedule=weekly_schedule,
                            week_dates=week_dates,
                            date_map=date_map,
-                           week_slots=week_slots)
+                           week_slots=week_slots,
+                           staff=load_staff(),
+                           staff_id=staff_id)
 
                            
 @app.route("/appointments")
@@ -432,275 +948,321 @@ def admin_appointments():
     appointments = load_appointments()
     return render_template("admin_appointments.html", appointments=appointments)
 
+# --- ניהול צוות (כיסאות) ---
+# סדר הרשימה הוא סדר העדיפות בשיבוץ תורים; לאיש צוות חדש אין שעות עד שמגדירים לו שגרה
+
+@app.route("/staff", methods=["GET", "POST"])
+def manage_staff():
+    if not session.get("is_admin"):
+        return jsonify({"error": "Unauthorized"}), 403
+    if request.method == "GET":
+        return json_response({"staff": load_staff()})
+    with booking_lock():
+        return update_staff(request.get_json())
+
+def update_staff(data):
+    action = data.get("action")
+    staff_id = data.get("staff_id", "").strip()
+    name = data.get("name", "").strip()
+    staff = [dict(member) for member in load_staff()]
+    member = next((m for m in staff if m["id"] == staff_id), None)
+
+    if action == "add":
+        if not valid_code(staff_id):
+            return jsonify({"error": "Invalid staff id"}), 400
+        if member is not None:
+            return jsonify({"error": "Staff id already exists"}), 400
+        create_staff_files(staff_id)
+        staff.append({"id": staff_id, "name": name})
+    elif action == "rename":
+        if member is None:
+            return jsonify({"error": "Unknown staff"}), 404
+        member["name"] = name
+    elif action == "remove":
+        if member is None:
+            return jsonify({"error": "Unknown staff"}), 404
+        if staff_id == DEFAULT_STAFF_ID:
+            return jsonify({"error": "The main staff member cannot be removed"}), 400
+        today = datetime.today().strftime("%Y-%m-%d")
+        if any(appt.get("staff") == staff_id
+               for d, apps_list in load_appointments().items() if d >= today for appt in apps_list):
+            return jsonify({"error": "Staff member has upcoming appointments"}), 400
+        staff.remove(member)
+    else:
+        return jsonify({"error": "Invalid action"}), 400
+
+    save_staff(staff)
+    if action != "rename":
+        mark_slots_changed()
+    return json_response({"staff": staff})
+
 # --- ניהול שגרה שבועית ---
 
 @app.route("/weekly_schedule", methods=["POST"])
+@locked_write
 def update_weekly_schedule():
     if not session.get("is_admin"):
         return jsonify({"error": "Unauthorized"}), 403
 
     data = request.get_json()
+    staff_id = request_staff_id(data)
+    if staff_id is None:
+        return jsonify({"error": "Unknown staff"}), 400
     action = data.get("action")
     day_key = data.get("day_key")
     time = data.get("time")
     new_time = data.get("new_time")
 
-    weekly_schedule = load_json(WEEKLY_SCHEDULE_FILE)
+    weekly_schedule = load_weekly_schedule(staff_id)
 
     if day_key not in [str(i) for i in range(7)]:
         return jsonify({"error": "Invalid day key"}), 400
 
+    mark_slots_changed()
+
     if action == "enable_day":
         if day_key not in weekly_schedule:
             weekly_schedule[day_key] = []
-        save_json(WEEKLY_SCHEDULE_FILE, weekly_schedule)
+        save_weekly_schedule(weekly_schedule, staff_id)
         return jsonify({"success": True})
 
     if action == "disable_day":
         weekly_schedule[day_key] = []
-        save_json(WEEKLY_SCHEDULE_FILE, weekly_schedule)
+        save_weekly_schedule(weekly_schedule, staff_id)
         return jsonify({"success": True})
 
-    day_times = weekly_schedule.get(day_key, [])
+    day_mask = times_to_mask(weekly_schedule.get(day_key, []))
+    minute, new_minute = minute_of(time), minute_of(new_time)
 
-    if action == "add" and time:
-        if time not in day_times:
-            day_times.append(time)
-            day_times.sort()
-            weekly_schedule[day_key] = day_times
-    elif action == "remove" and time:
-        if time in day_times:
-            day_times.remove(time)
-            weekly_schedule[day_key] = day_times
-    elif action == "edit" and time and new_time:
-        if time in day_times:
-            day_times.remove(time)
-            if new_time not in day_times:
-                day_times.append(new_time)
-                day_times.sort()
-            weekly_schedule[day_key] = day_times
+    if action == "add" and minute is not None:
+        day_mask |= 1 << minute
+    elif action == "remove" and minute is not None:
+        day_mask &= ~(1 << minute)
+    elif action == "edit" and minute is not None and new_minute is not None:
+        if day_mask >> minute & 1:
+            day_mask = day_mask & ~(1 << minute) | 1 << new_minute
     else:
         return jsonify({"error": "Invalid action or missing time"}), 400
 
-    save_json(WEEKLY_SCHEDULE_FILE, weekly_schedule)
-    return jsonify({"message": "Weekly schedule updated", "weekly_schedule": weekly_schedule})
+    weekly_schedule[day_key] = mask_to_times(day_mask)
+    save_weekly_schedule(weekly_schedule, staff_id)
+    return json_response({"message": "Weekly schedule updated", "weekly_schedule": weekly_schedule})
 
 @app.route("/weekly_toggle_day", methods=["POST"])
+@locked_write
 def toggle_weekly_day():
     if not session.get("is_admin"):
         return jsonify({"error": "Unauthorized"}), 403
 
     data = request.get_json()
+    staff_id = request_staff_id(data)
+    if staff_id is None:
+        return jsonify({"error": "Unknown staff"}), 400
     day_key = data.get("day_key")
     enabled = data.get("enabled")
 
     if day_key not in [str(i) for i in range(7)]:
         return jsonify({"error": "Invalid day key"}), 400
 
-    weekly_schedule = load_json(WEEKLY_SCHEDULE_FILE)
+    weekly_schedule = load_weekly_schedule(staff_id)
     weekly_schedule[day_key] = [] if not enabled else weekly_schedule.get(day_key, [])
-    save_json(WEEKLY_SCHEDULE_FILE, weekly_schedule)
+    save_weekly_schedule(weekly_schedule, staff_id)
+    mark_slots_changed()
 
-    return jsonify({"message": "Day updated", "weekly_schedule": weekly_schedule})
+    return json_response({"message": "Day updated", "weekly_schedule": weekly_schedule})
 
 
 # --- ניהול שינויים חד פעמיים (overrides) ---
 
 @app.route("/overrides", methods=["POST"])
+@locked_write
 def update_overrides():
     if not session.get("is_admin"):
         return jsonify({"error": "Unauthorized"}), 403
 
     data = request.get_json()
+    staff_id = request_staff_id(data)
+    if staff_id is None:
+        return jsonify({"error": "Unknown staff"}), 400
     action = data.get("action")
     date = data.get("date")
     time = data.get("time")
     new_time = data.get("new_time")
 
-    overrides = load_json(OVERRIDES_FILE)
-
-    if date not in overrides:
-        overrides[date] = {"add": [], "remove": []}
+    overrides = load_overrides(staff_id)
+    day = get_day_override(overrides, date)
+    mark_slots_changed(date)
 
     if action == "remove_many":
         times = data.get("times", [])
         for t in times:
-            if t not in overrides[date]["remove"]:
-                overrides[date]["remove"].append(t)
-            if t in overrides[date]["add"]:
-                overrides[date]["add"].remove(t)
-        save_json(OVERRIDES_FILE, overrides)
-        return jsonify({"message": "Multiple times removed", "overrides": overrides})
+            if t not in day["remove"]:
+                day["remove"].append(t)
+            if t in day["add"]:
+                day["add"].remove(t)
+        save_overrides(overrides, staff_id)
+        return json_response({"message": "Multiple times removed", "overrides": overrides_delta(overrides, date)})
 
     elif action == "add" and time:
-        if time not in overrides[date]["add"]:
-            overrides[date]["add"].append(time)
-        if time in overrides[date]["remove"]:
-            overrides[date]["remove"].remove(time)
-        save_json(OVERRIDES_FILE, overrides)
-        return jsonify({"message": "Time added", "overrides": overrides})
+        override_add_time(day, time)
+        save_overrides(overrides, staff_id)
+        return json_response({"message": "Time added", "overrides": overrides_delta(overrides, date)})
 
     elif action == "remove" and time:
-        if "remove" not in overrides[date]:
-            overrides[date]["remove"] = []
-        if "add" not in overrides[date]:
-            overrides[date]["add"] = []
-        if time not in overrides[date]["remove"]:
-            overrides[date]["remove"].append(time)
-        if time in overrides[date]["add"]:
-            overrides[date]["add"].remove(time)
-        if "edit" in overrides[date]:
-            overrides[date]["edit"] = [
-                e for e in overrides[date]["edit"]
-                if e.get("from") != time and e.get("to") != time
-            ]
-            if not overrides[date]["edit"]:
-                overrides[date].pop("edit", None)
-        save_json(OVERRIDES_FILE, overrides)
-        return jsonify({"message": "Time removed", "overrides": overrides})
+        override_remove_time(day, time)
+        save_overrides(overrides, staff_id)
+        return json_response({"message": "Time removed", "overrides": overrides_delta(overrides, date)})
 
     elif action == "edit" and time and new_time:
         if time == new_time:
             return jsonify({"message": "No changes made"})
-
-        if "edit" not in overrides[date]:
-            overrides[date]["edit"] = []
-
-        overrides[date]["edit"] = [
-            item for item in overrides[date]["edit"] if item.get("from") != time
-        ]
-
-        overrides[date]["edit"].append({
-            "from": time,
-            "to": new_time
-        })
-
-        if "remove" not in overrides[date]:
-            overrides[date]["remove"] = []
-        if time not in overrides[date]["remove"]:
-            overrides[date]["remove"].append(time)
-
-        if "add" not in overrides[date]:
-            overrides[date]["add"] = []
-        if new_time not in overrides[date]["add"]:
-            overrides[date]["add"].append(new_time)
-
-        save_json(OVERRIDES_FILE, overrides)
-        return jsonify({"message": "Time edited", "overrides": overrides})
+        override_edit_time(day, time, new_time)
+        save_overrides(overrides, staff_id)
+        return json_response({"message": "Time edited", "overrides": overrides_delta(overrides, date)})
 
     elif action == "clear" and date:
-        if date in overrides:
-            overrides.pop(date)
-        save_json(OVERRIDES_FILE, overrides)
-        return jsonify({"message": "Day overrides cleared", "overrides": overrides})
+        overrides.pop(date, None)
+        save_overrides(overrides, staff_id)
+        return json_response({"message": "Day overrides cleared", "overrides": overrides_delta(overrides, date)})
 
     elif action == "disable_day" and date:
         overrides[date] = {"add": [], "remove": ["__all__"]}
-        save_json(OVERRIDES_FILE, overrides)
-        return jsonify({"message": "Day disabled", "overrides": overrides})
+        save_overrides(overrides, staff_id)
+        return json_response({"message": "Day disabled", "overrides": overrides_delta(overrides, date)})
 
     elif action == "revert" and date and time:
-        if date in overrides:
-            if "add" in overrides[date] and time in overrides[date]["add"]:
-                overrides[date]["add"].remove(time)
-
-            if "remove" in overrides[date] and time in overrides[date]["remove"]:
-                overrides[date]["remove"].remove(time)
-
-            if "edit" in overrides[date]:
-                overrides[date]["edit"] = [
-                    e for e in overrides[date]["edit"]
-                    if e.get("to") != time and e.get("from") != time
-                ]
-                if not overrides[date]["edit"]:
-                    overrides[date].pop("edit", None)
-
-            if not overrides[date].get("add") and not overrides[date].get("remove") and not overrides[date].get("edit"):
-                overrides.pop(date)
-
-        save_json(OVERRIDES_FILE, overrides)
-        return jsonify({"message": "Time reverted", "overrides": overrides})
+        override_revert_time(day, time)
+        prune_day_override(overrides, date)
+        save_overrides(overrides, staff_id)
+        return json_response({"message": "Time reverted", "overrides": overrides_delta(overrides, date)})
 
     else:
         return jsonify({"error": "Invalid action or missing parameters"}), 400
 
 
 @app.route("/overrides_toggle_day", methods=["POST"])
+@locked_write
 def toggle_override_day():
     if not session.get("is_admin"):
         return jsonify({"error": "Unauthorized"}), 403
 
     data = request.get_json()
+    staff_id = request_staff_id(data)
+    if staff_id is None:
+        return jsonify({"error": "Unknown staff"}), 400
     date = data.get("date")
     enabled = data.get("enabled")
 
-    overrides = load_json(OVERRIDES_FILE)
+    overrides = load_overrides(staff_id)
 
     if not enabled:
         overrides[date] = {"add": [], "remove": ["__all__"]}
-    else:
-        if date in overrides and overrides[date].get("remove") == ["__all__"]:
-            overrides.pop(date)
+    elif date in overrides and is_day_disabled(overrides[date]):
+        overrides[date]["remove"].remove("__all__")
+        prune_day_override(overrides, date)
+
+    save_overrides(overrides, staff_id)
+    mark_slots_changed(date)
+    return json_response({"message": "Day override toggled", "overrides": overrides_delta(overrides, date)})
 
-    save_json(OVERRIDES_FILE, overrides)
-    return jsonify({"message": "Day override toggled", "overrides": overrides})
+# נקודות הקצה של /admin/one-time כותבות ישירות ל-overrides (מקור אמת יחיד)
 
 @app.route('/admin/one-time/toggle_day', methods=['POST'])
+@locked_write
 def toggle_day():
+    if not session.get("is_admin"):
+        return jsonify({"error": "Unauthorized"}), 403
+
     data = request.json
+    staff_id = request_staff_id(data)
+    if staff_id is None:
+        return jsonify({"error": "Unknown staff"}), 400
     date = data['date']
-    one_time = load_one_time_changes()
-    if date not in one_time:
-        return jsonify({'error': 'Date not found'}), 404
-
-    all_disabled = all(not slot['available'] for slot in one_time[date])
-    for slot in one_time[date]:
-        slot['available'] = not all_disabled
-
-    save_one_time_changes(one_time)
+    overrides = load_overrides(staff_id)
+    day = get_day_override(overrides, date)
+    if is_day_disabled(day):
+        day["remove"].remove("__all__")
+    else:
+        day["remove"].append("__all__")
+    prune_day_override(overrides, date)
+    save_overrides(overrides, staff_id)
+    mark_slots_changed(date)
     return jsonify({'message': 'Day toggled successfully'})
 
 @app.route('/admin/one-time/delete', methods=['POST'])
+@locked_write
 def delete_slot():
+    if not session.get("is_admin"):
+        return jsonify({"error": "Unauthorized"}), 403
+
     data = request.json
+    staff_id = request_staff_id(data)
+    if staff_id is None:
+        return jsonify({"error": "Unknown staff"}), 400
     date, time = data['date'], data['time']
-    one_time = load_one_time_changes()
-    if date in one_time:
-        one_time[date] = [slot for slot in one_time[date] if slot['time'] != time]
-        save_one_time_changes(one_time)
+    overrides = load_overrides(staff_id)
+    override_remove_time(get_day_override(overrides, date), time)
+    save_overrides(overrides, staff_id)
+    mark_slots_changed(date)
     return jsonify({'message': 'Slot deleted'})
 
 @app.route('/admin/one-time/edit', methods=['POST'])
+@locked_write
 def edit_slot():
+    if not session.get("is_admin"):
+        return jsonify({"error": "Unauthorized"}), 403
+
     data = request.json
+    staff_id = request_staff_id(data)
+    if staff_id is None:
+        return jsonify({"error": "Unknown staff"}), 400
     date, old_time, new_time = data['date'], data['old_time'], data['new_time']
-    one_time = load_one_time_changes()
-    for slot in one_time.get(date, []):
-        if slot['time'] == old_time:
-            slot['time'] = new_time
-            break
-    save_one_time_changes(one_time)
+    if old_time != new_time:
+        overrides = load_overrides(staff_id)
+        override_edit_time(get_day_override(overrides, date), old_time, new_time)
+        save_overrides(overrides, staff_id)
+        mark_slots_changed(date)
     return jsonify({'message': 'Slot edited'})
 
 @app.route('/admin/one-time/toggle_slot', methods=['POST'])
+@locked_write
 def toggle_slot():
+    if not session.get("is_admin"):
+        return jsonify({"error": "Unauthorized"}), 403
+
     data = request.json
+    staff_id = request_staff_id(data)
+    if staff_id is None:
+        return jsonify({"error": "Unknown staff"}), 400
     date, time = data['date'], data['time']
-    one_time = load_one_time_changes()
-    for slot in one_time.get(date, []):
-        if slot['time'] == time:
-            slot['available'] = not slot['available']
-            break
-    save_one_time_changes(one_time)
+    slots = build_slot_index().get(date)
+    staff_slots = slots.for_staff(staff_id) if slots is not None else None
+    overrides = load_overrides(staff_id)
+    day = get_day_override(overrides, date)
+    if staff_slots is not None and staff_slots.is_available(minute_of(time)):
+        override_remove_time(day, time)
+    else:
+        override_add_time(day, time)
+    prune_day_override(overrides, date)
+    save_overrides(overrides, staff_id)
+    mark_slots_changed(date)
     return jsonify({'message': 'Slot toggled'})
 
 @app.route('/admin/one-time/add', methods=['POST'])
+@locked_write
 def add_slot():
+    if not session.get("is_admin"):
+        return jsonify({"error": "Unauthorized"}), 403
+
     data = request.json
+    staff_id = request_staff_id(data)
+    if staff_id is None:
+        return jsonify({"error": "Unknown staff"}), 400
     date, time = data['date'], data['time']
-    one_time = load_one_time_changes()
-    one_time.setdefault(date, []).append({'time': time, 'available': True})
-    save_one_time_changes(one_time)
+    overrides = load_overrides(staff_id)
+    override_add_time(get_day_override(overrides, date), time)
+    save_overrides(overrides, staff_id)
+    mark_slots_changed(date)
     return jsonify({'message': 'Slot added'})
 
 @app.route('/appointment_details')
@@ -749,50 +1311,61 @@ def book_appointment():
     if service not in services_prices:
         return jsonify({"error": "Unknown service"}), 400
 
-    if not is_slot_available(date, time):
-        return jsonify({"error": "This time slot is not available"}), 400
-
-    appointments = load_appointments()
-    date_appointments = appointments.get(date, [])
-
-    for appt in date_appointments:
-        if appt["time"] == time:
-            return jsonify({"error": "This time slot is already booked"}), 400
-
-    appointment = {
-        "name": name,
-        "phone": phone,
-        "time": time,
-        "service": service,
-        "price": services_prices[service]
-    }
-    date_appointments.append(appointment)
-    appointments[date] = date_appointments
-    save_appointments(appointments)
+    # בדיקה זולה לפני כל הטעינות: כשכל הכיסאות מוחזקים ע"י לקוחות אחרים נדחים מיד
+    hold_id = data.get("hold_id") or session.get("hold_id")
+    other_holds = slot_holds.holders(DEFAULT_BUSINESS_CODE, date, time) - {hold_id}
+    if other_holds and len(other_holds) >= len(staff_ids()):
+        return jsonify({"error": "This time slot is being held by another customer"}), 400
+
+    with booking_lock():
+        day = build_slot_index(exclude_hold=hold_id).get(date)
+        minute = minute_of(time)
+        if day is None or not day.is_available(minute):
+            return jsonify({"error": "This time slot is not available"}), 400
+        staff_id = day.free_staff(minute)[0]
+
+        appointments = load_appointments()
+        date_appointments = appointments.get(date, [])
+
+        for appt in date_appointments:
+            if appt["time"] == time and appt.get("staff", DEFAULT_STAFF_ID) == staff_id:
+                return jsonify({"error": "This time slot is already booked"}), 400
+
+        appointment = {
+            "name": name,
+            "phone": phone,
+            "time": time,
+            "service": service,
+            "price": services_prices[service],
+            "staff": staff_id
+        }
+        date_appointments.append(appointment)
+        appointments[date] = date_appointments
+        save_appointments(appointments)
+
+        overrides = load_overrides(staff_id)
+        day = get_day_override(overrides, date)
+        day.setdefault("booked", []).append({
+            "time": time,
+            "name": name,
+            "phone": phone,
+            "service": service
+        })
+        if time not in day["remove"]:
+            day["remove"].append(time)
+        if time in day["add"]:
+            day["add"].remove(time)
 
-    overrides = load_json(OVERRIDES_FILE)
-    if date not in overrides:
-        overrides[date] = {"add": [], "remove": [], "edit": [], "booked": []}
-    elif "booked" not in overrides[date]:
-        overrides[date]["booked"] = []
+        save_overrides(overrides, staff_id)
 
-    overrides[date]["booked"].append({
-        "time": time,
-        "name": name,
-        "phone": phone,
-        "service": service
-    })
-    if time not in overrides[date]["remove"]:
-        overrides[date]["remove"].append(time)
-    if time in overrides[date]["add"]:
-        overrides[date]["add"].remove(time)
+    if hold_id:
+        slot_holds.release(DEFAULT_BUSINESS_CODE, hold_id)
+        if session.get("hold_id") == hold_id:
+            session.pop("hold_id")
 
-    save_json(OVERRIDES_FILE, overrides)
+    mark_slots_changed(date)
 
-    try:
-        send_email(name, phone, date, time, service, services_prices[service])
-    except Exception as e:
-        print("Error sending email:", e)
+    enqueue_email(send_email, name, phone, date, time, service, services_prices[service])
 
     return jsonify({
     "message": f"Appointment booked for {date} at {time} for {service}.",
@@ -803,7 +1376,56 @@ def book_appointment():
     "cancel_endpoint": "/cancel_appointment"
 })
 
+@app.route("/hold", methods=["POST"])
+@locked_write
+def hold_slot():
+    data = request.get_json()
+    date = data.get("date", "").strip()
+    time = data.get("time", "").strip()
+
+    if not date or not time:
+        return jsonify({"error": "Missing fields"}), 400
+
+    # החזקה אחת לכל לקוח - החזקה חדשה משחררת את הקודמת
+    previous = session.pop("hold_id", None)
+    if previous:
+        released = slot_holds.release(DEFAULT_BUSINESS_CODE, previous)
+        if released:
+            bump_availability_version()
+            mark_slots_changed(released[0])
+
+    client = request.remote_addr
+    if slot_holds.client_count(DEFAULT_BUSINESS_CODE, client) >= HOLD_MAX_PER_CLIENT:
+        return jsonify({"error": "Too many held slots, book or release one first"}), 429
+
+    day = build_slot_index().get(date)
+    minute = minute_of(time)
+    if day is None or not day.is_available(minute):
+        return jsonify({"error": "This time slot is not available"}), 400
+
+    # אפשר להחזיק שעה כל עוד יש כיסא פנוי שעוד לא מוחזק
+    hold_id = slot_holds.acquire(DEFAULT_BUSINESS_CODE, date, time, capacity=len(day.free_staff(minute)),
+                                 client=client)
+    if hold_id is None:
+        return jsonify({"error": "This time slot is being held by another customer"}), 400
+
+    session["hold_id"] = hold_id
+    bump_availability_version()
+    mark_slots_changed(date)
+    return json_response({"hold_id": hold_id, "date": date, "time": time, "expires_in": HOLD_TTL_SECONDS})
+
+@app.route("/release_hold", methods=["POST"])
+def release_hold():
+    data = request.get_json(silent=True) or {}
+    hold_id = data.get("hold_id") or session.pop("hold_id", None)
+    released = slot_holds.release(DEFAULT_BUSINESS_CODE, hold_id) if hold_id else None
+    if released:
+        bump_availability_version()
+        mark_slots_changed(released[0])
+    return json_response({"released": bool(released)})
+
 @app.route('/cancel_appointment', methods=['POST'])
+@locked_write
 def cancel_appointment():
     data = request.get_json()
     date = data.get('date')
@@ -811,12 +1433,7 @@ def cancel_appointment():
     name = data.get('name')
     phone = data.get('phone')
     
-    try:
-        with open(APPOINTMENTS_FILE, 'r', encoding='utf-8') as f:
-            appointments = json.load(f)
-    except FileNotFoundError:
-        appointments = {}
-
+    appointments = load_appointments()
     day_appointments = appointments.get(date, [])
 
     new_day_appointments = [
@@ -829,41 +1446,29 @@ def cancel_appointment():
 
     appointments[date] = new_day_appointments
 
-    with open(APPOINTMENTS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(appointments, f, ensure_ascii=False, indent=2)
-
-
-    try:
-        with open(OVERRIDES_FILE, 'r', encoding='utf-8') as f:
-            overrides = json.load(f)
-    except FileNotFoundError:
-        overrides = {}
+    save_appointments(appointments)
 
-    if date not in overrides:
-        overrides[date] = {"add": [], "remove": [], "edit": []}
+    # השעה חוזרת להיות פנויה אצל איש הצוות שהתור היה משובץ אליו
+    for staff_id in {appt.get('staff', DEFAULT_STAFF_ID) for appt in day_appointments
+                     if appt not in new_day_appointments}:
+        overrides = load_overrides(staff_id)
+        day = get_day_override(overrides, date)
 
-    if time in overrides[date].get("remove", []):
-        overrides[date]["remove"].remove(time)
+        if time in day["remove"]:
+            day["remove"].remove(time)
 
-    if time not in overrides[date].get("add", []):
-        overrides[date]["add"].append(time)
+        if time not in day["add"]:
+            day["add"].append(time)
 
-    with open(OVERRIDES_FILE, 'w', encoding='utf-8') as f:
-        json.dump(overrides, f, ensure_ascii=False, indent=2)
+        save_overrides(overrides, staff_id)
+    mark_slots_changed(date)
 
     return jsonify({'message': f'Appointment on {date} at {time} canceled successfully.'})
 
 # --- שליחת אימייל ---
 
 def send_email(name, phone, date, time, service, price):
-    EMAIL_USER = os.environ.get("EMAIL_USER")
-    EMAIL_PASS = os.environ.get("EMAIL_PASS")
-    if not EMAIL_USER or not EMAIL_PASS:
-        print("Missing EMAIL_USER or EMAIL_PASS environment variables")
-        return
-
-    msg = EmailMessage()
-    msg.set_content(f"""
+    deliver_email(f'New Appointment - {name}', f"""
 New appointment booked:
 
 Name: {name}
@@ -873,7 +1478,31 @@ Time: {time}
 Service: {service}
 Price: {price}₪
 """)
-    msg['Subject'] = f'New Appointment - {name}'
+
+def send_reminder_email(name, phone, date, time, service):
+    deliver_email(f'Reminder - {name} {date} {time}', f"""
+Upcoming appointment:
+
+Name: {name}
+Phone: {phone}
+Date: {date}
+Time: {time}
+Service: {service}
+""")
+
+def deliver_email(subject, content):
+    EMAIL_USER = os.environ.get("EMAIL_USER")
+    EMAIL_PASS = os.environ.get("EMAIL_PASS")
+    if not EMAIL_USER or not EMAIL_PASS:
+        print("Missing EMAIL_USER or EMAIL_PASS environment variables")
+        return
+
+    import smtplib
+    from email.message import EmailMessage
+
+    msg = EmailMessage()
+    msg.set_content(content)
+    msg['Subject'] = subject
     msg['From'] = EMAIL_USER
     msg['To'] = EMAIL_USER
 
@@ -886,19 +1515,225 @@ Price: {price}₪
     except Exception as e:
         print("Failed to send email:", e)
 
+# --- תור אימיילים ---
+# שליחת SMTP יוצאת מהבקשה ל-thread רקע; shutdown() מרוקן את התור לפני יציאה.
+
+_email_queue = queue.Queue()
+_email_worker = None
+_email_worker_lock = threading.Lock()
+
+def enqueue_email(send_func, *args):
+    _email_queue.put((send_func, args))
+    ensure_email_worker()
+
+def ensure_email_worker():
+    global _email_worker
+    with _email_worker_lock:
+        # אחרי fork (preload) ה-thread של תהליך האב לא קיים - מפעילים מחדש
+        if _email_worker is None or not _email_worker.is_alive():
+            _email_worker = threading.Thread(target=email_worker_loop, name="email-outbox", daemon=True)
+            _email_worker.start()
+
+def email_worker_loop():
+    while True:
+        send_func, args = _email_queue.get()
+        try:
+            send_func(*args)
+        except Exception as e:
+            print("Error sending email:", e)
+        finally:
+            _email_queue.task_done()
+
+def flush_emails(timeout=10):
+    deadline = monotonic() + timeout
+    while _email_queue.unfinished_tasks and monotonic() < deadline:
+        sleep(0.05)
+    return _email_queue.unfinished_tasks == 0
+
 # --- דף הצגת תורים (מנהל בלבד) ---
 
 @app.route("/availability")
 def availability():
-    week_slots = generate_week_slots()
-    return jsonify(week_slots)  # מחזיר מפתחות כמו "2025-08-01"
+    # לקוח שמחזיק שעה רואה אותה פנויה לעצמו
+    week_slots = generate_week_slots(exclude_hold=session.get("hold_id"))
+    return json_response(week_slots)  # מחזיר מפתחות כמו "2025-08-01"
+
+# --- עדכוני זמינות חיים (SSE) ---
+# כל כתיבה שמשנה זמינות מסמנת תאריכים (mark_slots_changed), וב-after_request נשלחת
+# דלתא לכל המנויים של העסק בתהליך. כתיבות מ-worker אחר מתגלות דרך גרסת הזמינות
+# ונשלחות כ-snapshot מלא. עם worker אסינכרוני (gevent/eventlet) כל חיבור הוא greenlet, וזרמים מוגבלים
+# ל-90% מ-worker_connections. עם gthread כל חיבור תופס thread עד שהוא נסגר, לכן SSE_MAX_CLIENTS תמיד
+# קטן ממספר ה-threads (ברירת מחדל חצי) - לעומס של שעת שיא משתמשים ב-gevent, ראו gunicorn.conf.py.
+# ב-SIGTERM (עצירה או restart חינני) הזרמים נסגרים מיד - ראו begin_shutdown.
+
+WORKER_CLASS = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+WORKER_THREADS = int(os.getenv("GUNICORN_THREADS", 4))
+WORKER_CONNECTIONS = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+if WORKER_CLASS in ("gevent", "eventlet"):
+    SSE_MAX_CLIENTS = int(os.getenv("SSE_MAX_CLIENTS", WORKER_CONNECTIONS * 9 // 10))
+else:
+    SSE_MAX_CLIENTS = min(int(os.getenv("SSE_MAX_CLIENTS", WORKER_THREADS // 2)), WORKER_THREADS - 1)
+SSE_POLL_SECONDS = 2
+SSE_HEARTBEAT_SECONDS = 15
+
+class SlotBroker:
+    """pub/sub בתוך התהליך: תור חסום לכל מנוי, לפי קוד עסק"""
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, business_code, limit=None):
+        """מחזיר תור, או None אם יש כבר limit מנויים בתהליך"""
+        q = queue.Queue(self.max_queue)
+        with self._lock:
+            if limit is not None and sum(len(subs) for subs in self._subscribers.values()) >= limit:
+                return None
+            self._subscribers.setdefault(business_code, set()).add(q)
+        return q
+
+    def unsubscribe(self, business_code, q):
+        with self._lock:
+            self._subscribers.get(business_code, set()).discard(q)
+
+    def count(self, business_code=None):
+        with self._lock:
+            if business_code is not None:
+                return len(self._subscribers.get(business_code, ()))
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    def publish(self, business_code, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(business_code, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # מנוי איטי - מרוקנים ומבקשים ממנו snapshot מלא במקום לחסום את הכותב
+                while not q.empty():
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        break
+                q.put_nowait({"type": "resync"})
+
+    def close_all(self):
+        """מעיר את כל הזרמים כדי שייסגרו (בכיבוי) בלי לחכות ל-SSE_POLL_SECONDS"""
+        with self._lock:
+            subscribers = [q for subs in self._subscribers.values() for q in subs]
+        for q in subscribers:
+            try:
+                q.put_nowait({"type": "close"})
+            except queue.Full:
+                pass  # הזרם יראה את _shutting_down בבדיקה הבאה
+
+slot_broker = SlotBroker()
+
+def mark_slots_changed(*dates):
+    """ללא תאריכים = כל החלון (למשל שינוי בשגרה השבועית)"""
+    changed = g.setdefault("changed_dates", set())
+    changed.update(dates or (None,))
+
+def available_times(day):
+    return mask_to_times(day.available)
+
+def publish_slot_delta(dates, business_code=DEFAULT_BUSINESS_CODE):
+    if not slot_broker.count(business_code):
+        return
+    index = build_slot_index()
+    if None in dates:
+        dates = index.keys()
+    slot_broker.publish(business_code, {
+        "type": "delta",
+        "version": get_availability_version(business_code),
+        "dates": {d: available_times(index[d]) for d in dates if d in index},
+    })
+
+@app.after_request
+def publish_changed_slots(response):
+    changed = g.get("changed_dates")
+    if changed and 200 <= response.status_code < 300:
+        publish_slot_delta(changed)
+    return response
+
+def sse_event(event_type, data):
+    return f"event: {event_type}\ndata: {dumps_compact(data).decode('utf-8')}\n\n"
+
+@app.route("/availability/stream")
+def availability_stream():
+    business_code = DEFAULT_BUSINESS_CODE
+    q = None if _shutting_down else slot_broker.subscribe(business_code, limit=SSE_MAX_CLIENTS)
+    if q is None:
+        return json_response({"error": "Too many live clients, poll /availability"}, 503)
+
+    def snapshot():
+        version = get_availability_version(business_code)
+        dates = {d: available_times(day) for d, day in build_slot_index().items()}
+        return version, sse_event("snapshot", {"type": "snapshot", "version": version, "dates": dates})
+
+    def stream():
+        try:
+            version, event = snapshot()
+            yield event
+            last_sent = monotonic()
+            while not _shutting_down:
+                try:
+                    event = q.get(timeout=SSE_POLL_SECONDS)
+                except queue.Empty:
+                    event = None
+
+                if event is not None and event["type"] == "close":
+                    return
+                if event is not None and event["type"] == "delta":
+                    version = event["version"]
+                    yield sse_event("delta", event)
+                elif event is not None or get_availability_version(business_code) != version:
+                    version, data = snapshot()
+                    yield data
+                elif monotonic() - last_sent >= SSE_HEARTBEAT_SECONDS:
+                    yield ": ping\n\n"
+                else:
+                    continue
+                last_sent = monotonic()
+        finally:
+            slot_broker.unsubscribe(business_code, q)
+
+    response = app.response_class(stream(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 # --- דף הבית ---
 
 @app.route("/")
 def index():
-    week_slots = generate_week_slots()
-    return render_template("index.html", week_slots=week_slots, services=services_prices)
+    # משתמש מחובר או לקוח עם החזקה רואים תוכן לפי session - רק דף אנונימי נשמר במטמון
+    if g.get('username') or session.get("hold_id"):
+        week_slots = generate_week_slots(exclude_hold=session.get("hold_id"))
+        return render_template("index.html", week_slots=week_slots, services=services_prices)
+
+    business_code = DEFAULT_BUSINESS_CODE
+    stamp = availability_stamp(business_code)
+    version = get_availability_version(business_code, stamp)
+    today = datetime.today().strftime("%Y-%m-%d")
+
+    cached = get_cached_page(business_code, version, today)
+    if cached is None:
+        html = render_template("index.html", week_slots=generate_week_slots(), services=services_prices)
+        cached = store_cached_page(business_code, version, today, html)
+    body, is_gzip = cached
+
+    if is_gzip and "gzip" not in request.headers.get("Accept-Encoding", ""):
+        body, is_gzip = gzip.decompress(body), False
+
+    response = app.response_class(body, mimetype="text/html")
+    if is_gzip:
+        response.headers["Content-Encoding"] = "gzip"
+    response.headers["Vary"] = "Accept-Encoding, Cookie"
+    # בלי המונה המקומי: אותו תוכן מקבל אותו ETag מכל worker
+    response.set_etag(f"{business_code}-{stamp}-{today}-{int(is_gzip)}")
+    return response.make_conditional(request)
 
 
 
@@ -937,6 +1772,8 @@ def ask_bot():
     }
 
     try:
+        import requests
+
         response = requests.post(
             "https://models.github.ai/inference/v1/chat/completions",
             headers=headers,
@@ -951,8 +1788,497 @@ def ask_bot():
         fallback_answer = "מצטער, לא הצלחתי לעבד את השאלה כרגע."
         return jsonify({"answer": fallback_answer})
 
+# --- ייבוא/ייצוא בכמות (CSV / JSONL) ---
+# הקלט נקרא שורה-שורה במנות של IMPORT_BATCH_SIZE שורות, כך שהזיכרון לא תלוי בגודל הקובץ.
+# כל מנה נבדקת ונשמרת תחת booking_lock על עותק טרי של המסמך.
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 50000))
+MAX_REPORTED_ERRORS = 100
+TIME_RE = re.compile(r"([01]\d|2[0-3]):[0-5]\d")
+PRICE_RE = re.compile(r"(\d{1,9})(\.0*)?")  # מספר שלם אי-שלילי ("80" או "80.0" מגיליון)
+
+def valid_date(value):
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def row_value(row, key):
+    value = row.get(key)
+    return str(value).strip() if value is not None else ""
+
+def import_appointment_row(appointments, row):
+    date, time, service = row_value(row, "date"), row_value(row, "time"), row_value(row, "service")
+    name, phone = row_value(row, "name"), row_value(row, "phone")
+    if not valid_date(date):
+        raise ValueError(f"invalid date '{date}'")
+    if not TIME_RE.fullmatch(time):
+        raise ValueError(f"invalid time '{time}'")
+    if not name or not phone:
+        raise ValueError("missing name or phone")
+    if service not in services_prices:
+        raise ValueError(f"unknown service '{service}'")
+    staff_id = row_value(row, "staff") or DEFAULT_STAFF_ID
+    if staff_id != DEFAULT_STAFF_ID and staff_id not in staff_ids():
+        raise ValueError(f"unknown staff '{staff_id}'")
+    price = row_value(row, "price")
+    price_match = PRICE_RE.fullmatch(price) if price else None
+    if price and not price_match:
+        raise ValueError(f"invalid price '{price}'")
+    day = appointments.setdefault(date, [])
+    if any(appt.get("time") == time and appt.get("staff", DEFAULT_STAFF_ID) == staff_id for appt in day):
+        raise ValueError(f"{date} {time} is already booked")
+    day.append({
+        "name": name,
+        "phone": phone,
+        "time": time,
+        "service": service,
+        "price": int(price_match.group(1)) if price else services_prices[service],
+        "staff": staff_id
+    })
+
+def import_override_row(overrides, row):
+    date, action = row_value(row, "date"), row_value(row, "action")
+    time, new_time = row_value(row, "time"), row_value(row, "new_time")
+    if not valid_date(date):
+        raise ValueError(f"invalid date '{date}'")
+    if action == "disable_day":
+        overrides[date] = {"add": [], "remove": ["__all__"]}
+        return
+    if action not in ("add", "remove", "edit"):
+        raise ValueError(f"invalid action '{action}'")
+    if not TIME_RE.fullmatch(time) or (action == "edit" and not TIME_RE.fullmatch(new_time)):
+        raise ValueError(f"invalid time '{time}' / '{new_time}'" if action == "edit" else f"invalid time '{time}'")
+    day = get_day_override(overrides, date)
+    if action == "add":
+        override_add_time(day, time)
+    elif action == "remove":
+        override_remove_time(day, time)
+    else:
+        override_edit_time(day, time, new_time)
+
+def import_weekly_row(weekly_schedule, row):
+    day_key, time = row_value(row, "day_key"), row_value(row, "time")
+    if day_key not in [str(i) for i in range(7)]:
+        raise ValueError(f"invalid day key '{day_key}'")
+    if not TIME_RE.fullmatch(time):
+        raise ValueError(f"invalid time '{time}'")
+    day_times = weekly_schedule.setdefault(day_key, [])
+    if time not in day_times:
+        day_times.append(time)
+
+def commit_weekly_schedule(weekly_schedule, staff_id):
+    for day_times in weekly_schedule.values():
+        day_times.sort()
+    save_weekly_schedule(weekly_schedule, staff_id)
+
+def export_appointment_rows(appointments):
+    for date in sorted(appointments):
+        for appt in appointments[date]:
+            yield dict(appt, date=date)
+
+def export_override_rows(overrides):
+    for date in sorted(overrides):
+        day = overrides[date]
+        if is_day_disabled(day):
+            yield {"date": date, "action": "disable_day"}
+            continue
+        for time in day.get("add", []):
+            yield {"date": date, "action": "add", "time": time}
+        for time in day.get("remove", []):
+            yield {"date": date, "action": "remove", "time": time}
+        for edit in day.get("edit", []):
+            yield {"date": date, "action": "edit", "time": edit["from"], "new_time": edit["to"]}
+
+def export_weekly_rows(weekly_schedule):
+    for day_key in sorted(weekly_schedule):
+        for time in weekly_schedule[day_key]:
+            yield {"day_key": day_key, "time": time}
+
+# kind -> (fields, load(staff_id), import_row, commit(store, staff_id), export_rows)
+# התורים משותפים לכל הצוות (עמודת staff), overrides ושגרה שבועית הם של איש צוות אחד
+BULK_KINDS = {
+    "appointments": (["date", "time", "name", "phone", "service", "price", "staff"],
+                     lambda staff_id: load_appointments(), import_appointment_row,
+                     lambda appointments, staff_id: save_appointments(appointments), export_appointment_rows),
+    "overrides": (["date", "action", "time", "new_time"],
+                  load_overrides, import_override_row, save_overrides, export_override_rows),
+    "weekly_schedule": (["day_key", "time"],
+                        load_weekly_schedule, import_weekly_row, commit_weekly_schedule, export_weekly_rows),
+}
+BULK_FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+# שם וטלפון מגיעים מ-/book הציבורי: תא CSV שמתחיל בתו נוסחה (=HYPERLINK(...)) ירוץ בגיליון.
+# בייצוא מוסיפים ' לפניו, ובייבוא מסירים אותו - כך ש-"+972..." עובר סבב ייצוא-ייבוא כמו שהוא
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+def csv_escape(value):
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def csv_unescape(value):
+    if isinstance(value, str) and value[:1] == "'" and value[1:].startswith(CSV_FORMULA_PREFIXES):
+        return value[1:]
+    return value
+
+def iter_rows(stream, fmt):
+    """מחזיר (מספר שורה, שורה, שגיאה) - שורה אחת בכל פעם"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, {key: csv_unescape(value) for key, value in row.items()}, None
+        return
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_no, None, "row must be a JSON object"
+            continue
+        yield line_no, row, None
+
+def import_rows(kind, stream, fmt, dry_run=False, staff_id=DEFAULT_STAFF_ID):
+    _, load, import_row, commit, _ = BULK_KINDS[kind]
+    result = {"kind": kind, "imported": 0, "error_count": 0, "errors": [], "dry_run": dry_run}
+    store = load(staff_id) if dry_run else None
+
+    def apply(store, batch):
+        for line_no, row, error in batch:
+            try:
+                if error:
+                    raise ValueError(error)
+                import_row(store, row)
+            except (ValueError, TypeError, OverflowError) as e:
+                result["error_count"] += 1
+                if len(result["errors"]) < MAX_REPORTED_ERRORS:
+                    result["errors"].append({"line": line_no, "error": str(e)})
+                continue
+            result["imported"] += 1
+
+    def flush(batch):
+        if dry_run:
+            apply(store, batch)
+            return
+        # נועלים רק סביב מנה: טוענים מחדש (כולל הזמנות שנכנסו בינתיים), מחילים ושומרים.
+        # /book ממתין לכל היותר למנה אחת ולא לכל הייבוא
+        with booking_lock():
+            batch_store = load(staff_id)
+            imported = result["imported"]
+            apply(batch_store, batch)
+            if result["imported"] > imported:
+                commit(batch_store, staff_id)
+
+    batch = []
+    for item in iter_rows(stream, fmt):
+        batch.append(item)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    return result
+
+def export_lines(kind, fmt, staff_id=DEFAULT_STAFF_ID):
+    fields, load, _, _, export_rows = BULK_KINDS[kind]
+    rows = export_rows(load(staff_id))
+    if fmt == "jsonl":
+        for row in rows:
+            yield dumps_compact({k: row[k] for k in fields if k in row}).decode("utf-8") + "\n"
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fields, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({key: csv_escape(value) for key, value in row.items()})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+@app.route("/admin/export/<kind>")
+def export_data(kind):
+    if not session.get("is_admin"):
+        return jsonify({"error": "Unauthorized"}), 403
+    fmt = request.args.get("format", "csv")
+    if kind not in BULK_KINDS or fmt not in BULK_FORMATS:
+        return jsonify({"error": "Invalid kind or format"}), 400
+    staff_id = request_staff_id()
+    if staff_id is None:
+        return jsonify({"error": "Unknown staff"}), 400
+
+    response = app.response_class(export_lines(kind, fmt, staff_id), mimetype=BULK_FORMATS[fmt])
+    response.headers["Content-Disposition"] = f"attachment; filename={kind}.{fmt}"
+    return response
+
+@app.route("/admin/import/<kind>", methods=["POST"])
+def import_data(kind):
+    if not session.get("is_admin"):
+        return jsonify({"error": "Unauthorized"}), 403
+    fmt = request.args.get("format", "csv")
+    if kind not in BULK_KINDS or fmt not in BULK_FORMATS:
+        return jsonify({"error": "Invalid kind or format"}), 400
+    staff_id = request_staff_id()
+    if staff_id is None:
+        return jsonify({"error": "Unknown staff"}), 400
+
+    # קובץ מטופס (multipart) או גוף הבקשה עצמו - בשני המקרים נקרא כזרם. request.files נגיש רק
+    # ב-multipart: בגוף urlencoded (ברירת המחדל של curl --data) פענוח הטופס היה בולע את הגוף
+    if request.mimetype == "multipart/form-data":
+        upload = request.files.get("file")
+        if upload is None:
+            return jsonify({"error": "Missing file"}), 400
+        raw = upload.stream
+    elif request.mimetype in BULK_FORMATS.values():
+        raw = io.BufferedReader(request.stream)
+    else:
+        return jsonify({"error": "Unsupported content type, use multipart/form-data, text/csv or application/x-ndjson"}), 415
+    stream = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+
+    result = import_rows(kind, stream, fmt, dry_run=request.args.get("dry_run") == "1", staff_id=staff_id)
+    if result["imported"] and not result["dry_run"]:
+        mark_slots_changed()
+    return json_response(result)
+
+@app.cli.command("export-data")
+@click.argument("kind", type=click.Choice(list(BULK_KINDS)))
+@click.argument("path", type=click.Path(dir_okay=False, allow_dash=True))
+@click.option("--format", "fmt", type=click.Choice(list(BULK_FORMATS)), default="csv")
+@click.option("--staff", "staff_id", default=DEFAULT_STAFF_ID, help="איש הצוות (overrides / weekly_schedule)")
+def export_data_command(kind, path, fmt, staff_id):
+    """מייצא appointments / overrides / weekly_schedule לקובץ (או '-' לפלט הרגיל)"""
+    if staff_id not in staff_ids():
+        raise click.BadParameter(f"unknown staff '{staff_id}'", param_hint="--staff")
+    with click.open_file(path, "w", encoding="utf-8", lazy=False) as f:
+        for line in export_lines(kind, fmt, staff_id):
+            f.write(line)
+
+@app.cli.command("import-data")
+@click.argument("kind", type=click.Choice(list(BULK_KINDS)))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option("--format", "fmt", type=click.Choice(list(BULK_FORMATS)), default="csv")
+@click.option("--dry-run", is_flag=True, help="בדיקת השורות בלבד, בלי לשמור")
+@click.option("--staff", "staff_id", default=DEFAULT_STAFF_ID, help="איש הצוות (overrides / weekly_schedule)")
+def import_data_command(kind, path, fmt, dry_run, staff_id):
+    """מייבא שורות מ-CSV/JSONL, שורה אחר שורה, עם שמירה במנות"""
+    if staff_id not in staff_ids():
+        raise click.BadParameter(f"unknown staff '{staff_id}'", param_hint="--staff")
+    if path == "-":
+        result = import_rows(kind, click.get_text_stream("stdin"), fmt, dry_run=dry_run, staff_id=staff_id)
+    else:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            result = import_rows(kind, f, fmt, dry_run=dry_run, staff_id=staff_id)
+    click.echo(f"{result['imported']} rows imported, {result['error_count']} rejected")
+    for error in result["errors"]:
+        click.echo(f"  line {error['line']}: {error['error']}", err=True)
+
+@app.cli.command("owner-node")
+@click.argument("business_code")
+def owner_node_command(business_code):
+    """מדפיס את השרת שמריץ את המופע של העסק (CLUSTER_NODES="a=http://10.0.0.1:3000,...")"""
+    nodes = parse_nodes(os.getenv("CLUSTER_NODES", ""))
+    if not nodes:
+        raise click.UsageError("CLUSTER_NODES is not set")
+    node_id = node_for(business_code, list(nodes))
+    click.echo(f"{node_id} {nodes[node_id]}")
+
+# --- משימות רקע ---
+# reminders ו-archive הן exclusive (תהליך אחד מכל ה-workers), prewarm רצה בכל worker.
+
+SCHEDULER_STATE_FILE = "scheduler_state.json"
+REMINDERS_FILE = "reminders_sent.json"
+APPOINTMENTS_ARCHIVE_FILE = "appointments_archive.json"
+REMINDER_HOURS_AHEAD = int(os.getenv("REMINDER_HOURS_AHEAD", 24))
+
+scheduler = Scheduler(SCHEDULER_STATE_FILE, load_json, save_json,
+                      max_workers=int(os.getenv("SCHEDULER_WORKERS", 2)), lock=storage.lock)
+
+def reminder_key(appt):
+    # כמה כיסאות יכולים להיות באותה שעה; לראשי נשאר המפתח הישן (רק השעה)
+    staff_id = appt.get('staff', DEFAULT_STAFF_ID)
+    return appt['time'] if staff_id == DEFAULT_STAFF_ID else f"{appt['time']}/{staff_id}"
+
+def send_due_reminders(now):
+    horizon = now + timedelta(hours=REMINDER_HOURS_AHEAD)
+    sent = load_json(REMINDERS_FILE)
+    changed = False
+    for date, apps_list in load_appointments().items():
+        for appt in apps_list:
+            try:
+                at = datetime.strptime(f"{date} {appt['time']}", "%Y-%m-%d %H:%M")
+            except (KeyError, ValueError):
+                continue
+            key = reminder_key(appt)
+            if not now <= at <= horizon or key in sent.get(date, []):
+                continue
+            enqueue_email(send_reminder_email, appt.get('name'), appt.get('phone'), date, appt['time'], appt.get('service'))
+            sent.setdefault(date, []).append(key)
+            changed = True
+    if changed:
+        save_json(REMINDERS_FILE, sent)
+
+def prewarm_slot_caches(now):
+    # אחרי חצות חלון generate_week_slots זז ביום - מרנדרים מראש את הדף של היום החדש
+    warm_caches()
+
+def archive_past_data(now):
+    """מעביר תורים שעברו לארכיון ומנקה overrides ותזכורות של תאריכים שעברו"""
+    today = now.strftime("%Y-%m-%d")
+
+    # הזמנה שנכנסת בזמן הריצה לא נדרסת בעותק המסונן
+    with booking_lock():
+        appointments = load_appointments()
+        past = {d: a for d, a in appointments.items() if d < today}
+        if past:
+            archive = load_json(APPOINTMENTS_ARCHIVE_FILE)
+            for d, apps_list in past.items():
+                archive.setdefault(d, []).extend(apps_list)
+            save_json(APPOINTMENTS_ARCHIVE_FILE, archive)
+            save_appointments({d: a for d, a in appointments.items() if d >= today})
+
+        for staff_id in staff_ids():
+            overrides = load_overrides(staff_id)
+            past_dates = [d for d in overrides if d < today]
+            if past_dates:
+                for d in past_dates:
+                    overrides.pop(d)
+                save_overrides(overrides, staff_id)
+
+    sent = load_json(REMINDERS_FILE)
+    if any(d < today for d in sent):
+        save_json(REMINDERS_FILE, {d: t for d, t in sent.items() if d >= today})
+
+def register_jobs(target):
+    target.add_job("reminders", send_due_reminders, every(15 * 60), exclusive=True)
+    target.add_job("prewarm", prewarm_slot_caches, daily("00:00"))
+    target.add_job("archive", archive_past_data, daily("03:00"), exclusive=True)
+
+def start_scheduler():
+    """נקרא בכל תהליך שמגיש בקשות (gunicorn post_fork / הרצה ישירה)"""
+    if os.getenv("SCHEDULER_ENABLED", "1") != "1":
+        return
+    if not scheduler.jobs:
+        register_jobs(scheduler)
+    scheduler.start()
+
+@app.route("/admin/jobs")
+def admin_jobs():
+    if not session.get("is_admin"):
+        return jsonify({"error": "Unauthorized"}), 403
+    return json_response(scheduler.stats())
+
+# --- פרופיילינג (opt-in) ---
+# בקשה בודדת: כותרת X-Profile: $PROFILE_TOKEN. דגימה קבועה: POST /admin/profiling {"sample_rate": 0.05}
+# (נשמר באחסון, כל worker קורא אותו מחדש כל כמה שניות). קבצי speedscope נכתבים ל-PROFILE_DIR,
+# והסיכום לפי route זמין ב-GET /admin/profiling (לכל worker בנפרד).
+
+PROFILING_FILE = "profiling.json"
+
+profiler = RequestProfiler(
+    os.getenv("PROFILE_DIR", "profiles"),
+    token=os.getenv("PROFILE_TOKEN", ""),
+    interval=float(os.getenv("PROFILE_INTERVAL_MS", 1)) / 1000,
+    load_settings=lambda: read_json(PROFILING_FILE),
+)
+
+def profile_route(environ):
+    """שיטה + כלל ה-route (למשל "POST /book"), כדי שכל הבקשות לאותו endpoint יצטברו יחד"""
+    try:
+        rule, _ = app.url_map.bind_to_environ(environ).match(return_rule=True)
+        path = rule.rule
+    except HTTPException:
+        path = environ.get("PATH_INFO", "")
+    return f"{environ.get('REQUEST_METHOD', 'GET')} {path}"
+
+app.wsgi_app = ProfilingMiddleware(app.wsgi_app, profiler, profile_route)
+
+@app.route("/admin/profiling", methods=["GET", "POST"])
+def admin_profiling():
+    if not session.get("is_admin"):
+        return jsonify({"error": "Unauthorized"}), 403
+    if request.method == "POST":
+        data = request.get_json() or {}
+        if "sample_rate" in data:
+            try:
+                rate = float(data["sample_rate"])
+            except (TypeError, ValueError):
+                rate = -1
+            if not 0 <= rate <= 1:
+                return jsonify({"error": "sample_rate must be between 0 and 1"}), 400
+            save_json(PROFILING_FILE, {"sample_rate": rate})
+            profiler.sample_rate = rate  # מיד ב-worker הזה, בשאר תוך reload_seconds
+        if data.get("reset"):
+            profiler.reset()
+    return json_response({"sample_rate": profiler.sample_rate, "output_dir": profiler.output_dir,
+                          "pid": os.getpid(), "routes": profiler.summary()})
+
+# --- בריאות ומוכנות ---
+
+_ready = False
+_shutting_down = False
+
+@app.route("/healthz")
+def healthz():
+    return json_response({"status": "ok"})
+
+@app.route("/readyz")
+def readyz():
+    if not _ready or _shutting_down:
+        return json_response({"status": "not ready"}, 503)
+    if storage.shared:
+        try:
+            storage.sync()
+        except Exception:
+            return json_response({"status": "storage unavailable"}, 503)
+    elif not os.access(BUSINESSES_ROOT, os.W_OK):
+        return json_response({"status": "data directory not writable"}, 503)
+    return json_response({"status": "ready", "pending_emails": _email_queue.unfinished_tasks})
+
 # --- הפעלת השרת ---
 
+def warm_caches():
+    """טוען את רישום העסקים ומרנדר מראש את הדף הציבורי (כולל קומפילציית Jinja)"""
+    load_businesses()
+    with app.test_request_context("/"):
+        app.preprocess_request()
+        index()
+
+def create_app():
+    """נקודת כניסה לפרודקשן (wsgi.py): תיקיות, חימום מטמונים וסימון מוכנות"""
+    global _ready
+    ensure_dirs()
+    with booking_lock():
+        migrate_one_time_changes()
+    try:
+        warm_caches()
+    except Exception as e:
+        print("Cache warm-up failed:", e)
+    _ready = True
+    return app
+
+def begin_shutdown():
+    """נקרא ב-SIGTERM, לפני ש-gunicorn מחכה לבקשות פתוחות: readyz נכשל וזרמי SSE נסגרים"""
+    global _shutting_down
+    _shutting_down = True
+    slot_broker.close_all()
+
+def shutdown(timeout=10):
+    """נקרא ביציאת worker: מפסיק לקבל תנועה ומרוקן אימיילים ממתינים"""
+    begin_shutdown()
+    scheduler.stop()
+    if not flush_emails(timeout):
+        print(f"Shutdown: {_email_queue.unfinished_tasks} emails were not sent")
+
+atexit.register(shutdown)
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 3000))
-    app.run(host="0.0.0.0", port=port)
+    create_app()
+    start_scheduler()
+    app.run(host="0.0.0.0", port=port, threaded=True)
@@ -0,0 +1,128 @@
+# בנצ'מרק תחרות על שעות: הזמנה ישירה מול החזקה (/hold) ואז הזמנה
+# שימוש: python bench_holds.py [--customers 40] [--slots 10] [--think-ms 50]
+# רץ בתיקייה זמנית עם test client של Flask - לא נוגע בקבצי הנתונים האמיתיים.
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+from datetime import date
+from time import monotonic, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class Results:
+    def __init__(self):
+        self.counts = {"booked": 0, "gave_up": 0, "book_calls": 0, "hold_calls": 0}
+        self.samples = {"book_latency": [], "time_to_book": []}
+        self._lock = threading.Lock()
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def sample(self, key, value):
+        with self._lock:
+            self.samples[key].append(value)
+
+
+def customer(app_module, use_holds, think_seconds, max_attempts, results, barrier, rng):
+    client = app_module.app.test_client()
+    client.environ_base["REMOTE_ADDR"] = f"10.0.{rng.randrange(256)}.{rng.randrange(256)}"  # כתובת לכל לקוח
+    today = date.today().isoformat()
+    barrier.wait()
+    started = monotonic()
+
+    for _ in range(max_attempts):
+        free = [t["time"] for t in client.get("/availability").get_json().get(today, {}).get("times", [])]
+        if not free:
+            break
+        slot = rng.choice(free)
+
+        if use_holds:
+            results.count("hold_calls")
+            if client.post("/hold", json={"date": today, "time": slot}).status_code != 200:
+                continue  # נדחה מיד, בלי למלא טופס
+
+        sleep(think_seconds)  # מילוי הטופס
+
+        t0 = monotonic()
+        response = client.post("/book", json={
+            "name": "bench", "phone": str(id(client)), "date": today, "time": slot, "service": "Color"})
+        results.sample("book_latency", (monotonic() - t0) * 1000)
+        results.count("book_calls")
+        if response.status_code == 200:
+            results.count("booked")
+            results.sample("time_to_book", (monotonic() - started) * 1000)
+            return
+    results.count("gave_up")
+
+
+def run(use_holds, args):
+    workdir = tempfile.mkdtemp(prefix="bench_holds_")
+    os.chdir(workdir)
+    import app as app_module
+
+    app_module.send_email = lambda *a: None
+    app_module.storage.delete(app_module.HOLDS_FILE)
+    today = date.today()
+    slots = [f"{9 + i // 4:02d}:{(i % 4) * 15:02d}" for i in range(args.slots)]
+    app_module.save_json(app_module.APPOINTMENTS_FILE, {})
+    app_module.save_json(app_module.OVERRIDES_FILE, {})
+    app_module.save_weekly_schedule({str(today.weekday()): slots})
+
+    results = Results()
+    barrier = threading.Barrier(args.customers)
+    threads = [threading.Thread(target=customer, args=(app_module, use_holds, args.think_ms / 1000,
+                                                     args.max_attempts, results, barrier,
+                                                     random.Random(args.seed + i)))
+               for i in range(args.customers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    booked_appointments = sum(len(v) for v in app_module.load_appointments().values())
+    return results, booked_appointments
+
+
+def report(label, results, booked_appointments):
+    counts, samples = results.counts, results.samples
+    calls = counts["book_calls"]
+    print(f"{label}:")
+    print(f"  customers booked     {counts['booked']} (gave up {counts['gave_up']}), appointments stored {booked_appointments}")
+    print(f"  /book calls          {calls}, success rate {counts['booked'] / calls * 100 if calls else 0:.1f}%,"
+          f" failed after validation {calls - counts['booked']}")
+    if counts["hold_calls"]:
+        print(f"  /hold calls          {counts['hold_calls']}")
+    print(f"  /book latency ms     p50 {percentile(samples['book_latency'], 50):.1f}"
+          f"  p95 {percentile(samples['book_latency'], 95):.1f}")
+    if samples["time_to_book"]:
+        print(f"  time to booking ms   median {statistics.median(samples['time_to_book']):.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Booking contention benchmark with and without slot holds")
+    parser.add_argument("--customers", type=int, default=40)
+    parser.add_argument("--slots", type=int, default=10)
+    parser.add_argument("--think-ms", type=float, default=50)
+    parser.add_argument("--max-attempts", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    report("without holds", *run(False, args))
+    report("with holds", *run(True, args))
+
+
+if __name__ == "__main__":
+    main()
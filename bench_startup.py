@@ -0,0 +1,60 @@
+# מדידת זמן עלייה (cold start) של app.py מול תקציב
+# שימוש: python bench_startup.py [--runs 5] [--budget-ms 250]
+# יוצא עם קוד 1 אם החציון חורג מהתקציב - מתאים להרצה ב-CI.
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+DEFAULT_BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", 250))
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_once(statement="import app"):
+    """מריץ `python -X importtime -c <statement>` בתהליך נקי ומחזיר {module: cumulative_us}"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=here, capture_output=True, text=True, check=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            timings[match.group(4)] = int(match.group(2))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup import-time benchmark for app.py")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.runs)]
+    app_ms = statistics.median(r["app"] for r in runs) / 1000
+
+    print(f"import app: median {app_ms:.1f}ms over {args.runs} runs (budget {args.budget_ms:.0f}ms)")
+    print(f"top {args.top} imports by cumulative time (last run):")
+    last = runs[-1]
+    for name, us in sorted(last.items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+        print(f"  {us / 1000:8.1f}ms  {name}")
+
+    # מודולים ש-Flask עצמו טוען לא נחשבים - בודקים רק מה ש-app.py מוסיף
+    added_by_app = set(last) - set(measure_once("import flask"))
+    for lazy in ("requests", "smtplib", "email.message", "shutil", "werkzeug.security", "brotli", "sqlite3"):
+        if lazy in added_by_app:
+            print(f"warning: '{lazy}' is imported at startup but should be lazy")
+
+    if app_ms > args.budget_ms:
+        print(f"FAIL: startup {app_ms:.1f}ms exceeds budget {args.budget_ms:.0f}ms")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+# שכבת תיאום להרצה על כמה שרתים (nodes): אחסון משותף, ערוץ ביטול מטמון ושיוך עסקים לשרתים.
+# ברירת המחדל (STORAGE_URL ריק) היא קבצי JSON בתיקיית העבודה - בדיוק כמו בהרצה על שרת אחד.
+# באחסון משותף לכל מסמך יש מספר גרסה גלובלי עולה; sync() קורא אילו מסמכים השתנו מאז הפעם
+# הקודמת, כך שמטמון מקומי (read_json, דף ציבורי, SSE) מתבטל גם כשהכתיבה נעשתה בשרת אחר.
+import hashlib
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from time import monotonic, sleep, time
+
+from scheduler import flock
+
+LOCK_TTL_SECONDS = 30
+
+
+class FileStorage:
+    """קבצים מקומיים - כמה workers על אותו דיסק. הגרסה היא (inode, mtime, size) של הקובץ"""
+    shared = False
+
+    def get(self, name):
+        try:
+            with open(name, "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, name, text):
+        # קובץ זמני והחלפה אטומית - worker שנהרג באמצע לא משאיר JSON חצוי
+        tmp_name = f"{name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            f = open(tmp_name, "w", encoding="utf-8")
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(name), exist_ok=True)
+            f = open(tmp_name, "w", encoding="utf-8")
+        with f:
+            f.write(text)
+        os.replace(tmp_name, name)
+
+    def delete(self, name):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+    def exists(self, name):
+        return os.path.exists(name)
+
+    def version(self, name):
+        try:
+            st = os.stat(name)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def stamp(self, names):
+        """מספר שעולה בכל שינוי של אחד המסמכים (כאן: ה-mtime המאוחר ביותר)"""
+        latest = 0
+        for name in names:
+            try:
+                latest = max(latest, os.stat(name).st_mtime_ns)
+            except FileNotFoundError:
+                pass
+        return latest
+
+    def sync(self):
+        return []  # כל קריאה בודקת stat, אין מה לסנכרן
+
+    def lock(self, name, blocking=True):
+        if os.path.dirname(name):
+            os.makedirs(os.path.dirname(name), exist_ok=True)
+        return flock(name, blocking)
+
+
+class SharedStorage:
+    """בסיס לאחסון משותף. version()/stamp() לא פונים לשרת - הם נשענים על הגרסאות שנקראו
+    ב-sync() האחרון, ו-sync() רץ לכל היותר פעם ב-poll_seconds (או מיד, כשקוראים לו ישירות)"""
+    shared = True
+
+    def __init__(self, poll_seconds=0.5):
+        self.poll_seconds = poll_seconds
+        self._versions = {}
+        self._cursor = 0
+        self._next_sync = 0.0
+        self._sync_lock = threading.Lock()
+        self._held = {}  # (name, owner) -> ttl של נעילות שמוחזקות בתהליך הזה
+        self._held_lock = threading.Lock()
+        self._renewer = None
+
+    def sync(self):
+        """קורא את ערוץ השינויים ומחזיר את שמות המסמכים שהשתנו מאז הקריאה הקודמת"""
+        with self._sync_lock:
+            changes = self._changes_since(self._cursor)
+            for name, version in changes:
+                self._versions[name] = max(self._versions.get(name, 0), version)
+                self._cursor = max(self._cursor, version)
+            self._next_sync = monotonic() + self.poll_seconds
+        return [name for name, _ in changes]
+
+    def _maybe_sync(self):
+        if monotonic() >= self._next_sync:
+            self.sync()
+
+    def _saved(self, name, version):
+        # קריאה-אחרי-כתיבה באותו שרת רואה מיד את הגרסה החדשה; הסמן לא זז כדי לא לדלג
+        # על שינויים של שרתים אחרים שעוד לא נקראו
+        with self._sync_lock:
+            self._versions[name] = max(self._versions.get(name, 0), version)
+
+    def exists(self, name):
+        return self.get(name) is not None
+
+    def version(self, name):
+        self._maybe_sync()
+        return self._versions.get(name)
+
+    def stamp(self, names):
+        self._maybe_sync()
+        return max((self._versions.get(name, 0) for name in names), default=0)
+
+    @contextmanager
+    def lock(self, name, blocking=True, ttl=LOCK_TTL_SECONDS):
+        """נעילה בין שרתים עם TTL - שרת שנפל לא משאיר נעילה תקועה. כל עוד הנעילה מוחזקת
+        היא מוארכת כל ttl/3, כך שעבודה ארוכה מ-ttl (ייבוא, משימת מתזמן) לא מאבדת אותה"""
+        owner = uuid.uuid4().hex
+        while not self._try_lock(name, owner, ttl):
+            if not blocking:
+                yield False
+                return
+            sleep(0.01)
+        self._hold(name, owner, ttl)
+        try:
+            yield True
+        finally:
+            with self._held_lock:
+                self._held.pop((name, owner), None)
+            self._unlock(name, owner)
+
+    def _hold(self, name, owner, ttl):
+        with self._held_lock:
+            self._held[(name, owner)] = ttl
+            # thread לא שורד fork - נוצר מחדש בפעם הראשונה בכל תהליך
+            if self._renewer is None or not self._renewer.is_alive():
+                self._renewer = threading.Thread(target=self._renew_loop, name="lock-renewer", daemon=True)
+                self._renewer.start()
+
+    def _renew_loop(self):
+        """thread אחד לכל תהליך מאריך את כל הנעילות המוחזקות"""
+        while True:
+            with self._held_lock:
+                interval = min(self._held.values(), default=LOCK_TTL_SECONDS) / 3
+            sleep(interval)
+            with self._held_lock:
+                held = list(self._held.items())
+            for (name, owner), ttl in held:
+                try:
+                    if not self._renew(name, owner, ttl) and (name, owner) in self._held:
+                        print(f"Lock '{name}' expired before it was renewed")
+                except Exception as e:
+                    print(f"Lock '{name}' renewal failed:", e)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (name TEXT PRIMARY KEY, data TEXT, version INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS documents_version ON documents (version);
+CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL);
+"""
+
+
+class SQLiteStorage(SharedStorage):
+    """קובץ SQLite משותף (WAL): כמה תהליכים, או כמה שרתים על אותו volume.
+    כל כתיבה מקבלת את הגרסה הבאה בתוך BEGIN IMMEDIATE, כך שסדר הגרסאות הוא סדר ה-commit"""
+
+    def __init__(self, path, poll_seconds=0.5):
+        super().__init__(poll_seconds)
+        self.path = path
+        self._local = threading.local()
+        self._db().executescript(SQLITE_SCHEMA)
+
+    def _db(self):
+        # חיבור לכל thread, וחיבור חדש אחרי fork (gunicorn preload)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            import sqlite3  # רק כשמשתמשים ב-backend הזה - לא בעלייה של כל שרת
+
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextmanager
+    def _write(self):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def get(self, name):
+        row = self._db().execute("SELECT data FROM documents WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, name, text):
+        with self._write() as db:
+            version = db.execute("SELECT coalesce(max(version), 0) + 1 FROM documents").fetchone()[0]
+            db.execute("INSERT INTO documents (name, data, version) VALUES (?, ?, ?) "
+                       "ON CONFLICT (name) DO UPDATE SET data = excluded.data, version = excluded.version",
+                       (name, text, version))
+        self._saved(name, version)
+
+    def delete(self, name):
+        self.put(name, None)  # נשאר כשורה ריקה עם גרסה חדשה, כדי ששרתים אחרים יראו את המחיקה
+
+    def _changes_since(self, cursor):
+        return self._db().execute(
+            "SELECT name, version FROM documents WHERE version > ? ORDER BY version", (cursor,)).fetchall()
+
+    def _try_lock(self, name, owner, ttl):
+        now = time()
+        with self._write() as db:
+            db.execute("DELETE FROM locks WHERE name = ? AND expires < ?", (name, now))
+            cursor = db.execute("INSERT OR IGNORE INTO locks (name, owner, expires) VALUES (?, ?, ?)",
+                                (name, owner, now + ttl))
+        return cursor.rowcount == 1
+
+    def _renew(self, name, owner, ttl):
+        cursor = self._db().execute("UPDATE locks SET expires = ? WHERE name = ? AND owner = ?",
+                                    (time() + ttl, name, owner))
+        return cursor.rowcount == 1
+
+    def _unlock(self, name, owner):
+        self._db().execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+
+# גרסה, כתיבה ורישום בערוץ השינויים בפעולה אטומית אחת
+REDIS_PUT_SCRIPT = """
+local version = redis.call('INCR', KEYS[3])
+if ARGV[3] == '1' then redis.call('DEL', KEYS[1]) else redis.call('SET', KEYS[1], ARGV[1]) end
+redis.call('ZADD', KEYS[2], version, ARGV[2])
+return version
+"""
+REDIS_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('PEXPIRE', KEYS[1], ARGV[2]) end
+return 0
+"""
+REDIS_UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+class RedisStorage(SharedStorage):
+    """Redis או שרת תואם. client מועבר מבחוץ - redis.Redis בפרודקשן, fakeredis בבדיקות"""
+
+    def __init__(self, client, prefix="barber:", poll_seconds=0.5):
+        super().__init__(poll_seconds)
+        self.client = client
+        self.prefix = prefix
+        self._versions_key = f"{prefix}versions"
+        self._put_script = client.register_script(REDIS_PUT_SCRIPT)
+        self._renew_script = client.register_script(REDIS_RENEW_SCRIPT)
+        self._unlock_script = client.register_script(REDIS_UNLOCK_SCRIPT)
+
+    def _key(self, kind, name):
+        return f"{self.prefix}{kind}:{name}"
+
+    def get(self, name):
+        value = self.client.get(self._key("doc", name))
+        return value.decode("utf-8") if value is not None else None
+
+    def _put(self, name, text, deleted):
+        version = self._put_script(keys=[self._key("doc", name), self._versions_key, f"{self.prefix}seq"],
+                                   args=[text, name, "1" if deleted else "0"])
+        self._saved(name, int(version))
+
+    def put(self, name, text):
+        self._put(name, text, False)
+
+    def delete(self, name):
+        self._put(name, "", True)
+
+    def _changes_since(self, cursor):
+        changes = self.client.zrangebyscore(self._versions_key, f"({cursor}", "+inf", withscores=True)
+        return [(name.decode("utf-8"), int(version)) for name, version in changes]
+
+    def _try_lock(self, name, owner, ttl):
+        return bool(self.client.set(self._key("lock", name), owner, nx=True, px=int(ttl * 1000)))
+
+    def _renew(self, name, owner, ttl):
+        return bool(self._renew_script(keys=[self._key("lock", name)], args=[owner, int(ttl * 1000)]))
+
+    def _unlock(self, name, owner):
+        self._unlock_script(keys=[self._key("lock", name)], args=[owner])
+
+
+class NamespacedStorage:
+    """מסמכים ונעילות של עסק אחד בתוך אחסון שמשרת כמה עסקים: כל שם מקבל קידומת "<namespace>/".
+    sync() מחזיר רק את השינויים של העסק הזה, בלי הקידומת"""
+
+    def __init__(self, storage, namespace):
+        self.storage = storage
+        self.prefix = f"{namespace}/"
+        self.shared = storage.shared
+
+    def get(self, name):
+        return self.storage.get(self.prefix + name)
+
+    def put(self, name, text):
+        self.storage.put(self.prefix + name, text)
+
+    def delete(self, name):
+        self.storage.delete(self.prefix + name)
+
+    def exists(self, name):
+        return self.storage.exists(self.prefix + name)
+
+    def version(self, name):
+        return self.storage.version(self.prefix + name)
+
+    def stamp(self, names):
+        return self.storage.stamp([self.prefix + name for name in names])
+
+    def sync(self):
+        return [name[len(self.prefix):] for name in self.storage.sync() if name.startswith(self.prefix)]
+
+    def lock(self, name, *args, **kwargs):
+        return self.storage.lock(self.prefix + name, *args, **kwargs)
+
+
+def open_storage(url="", poll_seconds=0.5):
+    """"" -> קבצים מקומיים, sqlite:///path/to.db, redis://host:6379/0"""
+    if not url:
+        return FileStorage()
+    if url.startswith("sqlite:///"):
+        return SQLiteStorage(url[len("sqlite:///"):], poll_seconds=poll_seconds)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("STORAGE_URL=redis://... requires the 'redis' package") from None
+        return RedisStorage(redis.Redis.from_url(url), poll_seconds=poll_seconds)
+    raise ValueError(f"Unsupported STORAGE_URL '{url}'")
+
+
+
+# --- שיוך עסקים לשרתים ---
+# החזקות, מנויי SSE ומטמון הדף חיים בזיכרון התהליך, ולכן כל עסק מוגש ממופע אחד (BUSINESS_CODE).
+# node_for קובע על איזה שרת רץ המופע של כל עסק, וה-proxy מנתב אליו לפי host או נתיב.
+
+def parse_nodes(spec):
+    """"a=http://10.0.0.1:3000,b=http://10.0.0.2:3000" -> {"a": "http://10.0.0.1:3000", ...}"""
+    nodes = {}
+    for item in spec.split(","):
+        node_id, _, url = item.strip().partition("=")
+        if node_id:
+            nodes[node_id.strip()] = url.strip().rstrip("/")
+    return nodes
+
+
+def node_for(key, node_ids):
+    """Rendezvous hashing: הוספה או הסרה של שרת מזיזה רק את העסקים של אותו שרת"""
+    if not node_ids:
+        return None
+    return max(node_ids, key=lambda node_id: hashlib.blake2b(f"{node_id}:{key}".encode("utf-8"),
+                                                             digest_size=8).digest())
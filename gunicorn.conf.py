@@ -0,0 +1,51 @@
+# הגדרות gunicorn לפרודקשן - ניתנות לשינוי דרך משתני סביבה
+import multiprocessing
+import os
+import signal
+
+wsgi_app = "wsgi:app"
+bind = f"0.0.0.0:{os.environ.get('PORT', 3000)}"
+
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# עם gthread כל זרם SSE פתוח (/availability/stream) תופס thread, ולכן מוגבל לפחות מ-threads לכל worker.
+# לעדכונים חיים בשעת עומס: GUNICORN_WORKER_CLASS=gevent (pip install gevent) - כל חיבור הוא greenlet,
+# ו-SSE_MAX_CLIENTS לתהליך נגזר מ-worker_connections. אפשר גם להריץ מופע gevent נפרד רק לזרם,
+# כשה-proxy מנתב אליו את /availability/stream ואת השאר למופע gthread.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+# טוען את האפליקציה (ומחמם מטמונים) פעם אחת בתהליך האב לפני fork
+preload_app = True
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+
+
+def post_worker_init(worker):
+    # ב-SIGTERM ה-worker מחכה לבקשות פתוחות עד graceful_timeout - סוגרים קודם את זרמי ה-SSE,
+    # אחרת כל דף הזמנה פתוח מעכב את העצירה וכל restart
+    from app import begin_shutdown
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(sig, frame):
+        begin_shutdown()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_int(worker):
+    from app import begin_shutdown
+    begin_shutdown()
+
+
+def worker_exit(server, worker):
+    from app import shutdown
+    shutdown()
+
+
+def post_fork(server, worker):
+    # threads לא שורדים fork - המתזמן מופעל בכל worker אחרי preload
+    from app import start_scheduler
+    start_scheduler()
@@ -0,0 +1,239 @@
+# מצב פרופיילינג לבקשות: דוגם את המחסנית של ה-thread שמטפל בבקשה כל interval שניות,
+# מצבר את הפונקציות הכבדות לפי route וכותב קובץ speedscope (https://www.speedscope.app) לכל בקשה.
+# הפעלה: כותרת X-Profile עם הטוקן הסודי (בקשה בודדת), או sample_rate > 0 (אחוז מהבקשות).
+# כשכבוי הבדיקה היא השוואה אחת ו-get על environ לכל בקשה.
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+from collections import Counter
+from time import monotonic, perf_counter, sleep, strftime
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+class ProfileSession:
+    """דגימות של בקשה אחת: מחסניות (מהשורש לעלה) עם משקל בזמן שעבר מהדגימה הקודמת"""
+
+    def __init__(self, name, filename, stop_code):
+        self.name = name
+        self.filename = filename
+        self.stop_code = stop_code
+        self.thread_id = threading.get_ident()
+        self.frames = []
+        self.frame_index = {}
+        self.samples = []
+        self.weights = []
+        self.started = self.last = perf_counter()
+        self.elapsed = 0.0
+
+    def sample(self, frame, now):
+        stack = []
+        while frame is not None and frame.f_code is not self.stop_code:
+            code = frame.f_code
+            index = self.frame_index.get(code)
+            if index is None:
+                index = self.frame_index[code] = len(self.frames)
+                self.frames.append({"name": code.co_qualname, "file": code.co_filename, "line": code.co_firstlineno})
+            stack.append(index)
+            frame = frame.f_back
+        if frame is None:
+            return  # הבקשה כבר יצאה מה-middleware
+        stack.reverse()
+        self.samples.append(stack)
+        self.weights.append((now - self.last) * 1000)
+        self.last = now
+
+    def finish(self):
+        self.elapsed = (perf_counter() - self.started) * 1000
+
+    def speedscope(self):
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": self.name,
+            "exporter": "barber profiling.py",
+            "activeProfileIndex": 0,
+            "shared": {"frames": self.frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"{self.name} ({self.elapsed:.1f}ms)",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(self.weights),
+                "samples": self.samples,
+                "weights": self.weights,
+            }],
+        }
+
+
+class Sampler:
+    """thread דוגם אחד לכל התהליך; רץ רק כשיש בקשה בפרופיילינג"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._switch_interval = None
+
+    def add(self, session):
+        with self._lock:
+            if not self._sessions:
+                # בקוד שמחזיק את ה-GIL הדוגם מחכה עד switch interval (5ms) - מקצרים רק בזמן דגימה
+                self._switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(self._switch_interval, self.interval))
+            self._sessions[session.thread_id] = session
+            self._wake.set()
+            # thread לא שורד fork - נוצר מחדש בפעם הראשונה בכל worker
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="profiler", daemon=True)
+                self._thread.start()
+
+    def remove(self, session):
+        # אחרי remove הדוגם לא נוגע יותר ב-session (הדגימה נעשית תחת אותה נעילה)
+        with self._lock:
+            self._sessions.pop(session.thread_id, None)
+            if not self._sessions:
+                self._wake.clear()
+                sys.setswitchinterval(self._switch_interval)
+
+    def _loop(self):
+        while True:
+            self._wake.wait()
+            sleep(self.interval)
+            frames = sys._current_frames()
+            now = perf_counter()
+            with self._lock:
+                for thread_id, session in self._sessions.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        session.sample(frame, now)
+
+
+def frame_label(frame):
+    parts = frame["file"].replace("\\", "/").split("/")
+    return f"{frame['name']} ({'/'.join(parts[-2:])}:{frame['line']})"
+
+
+class RequestProfiler:
+    """מחליט אילו בקשות לדגום, מצבר פונקציות כבדות לכל route וכותב קבצי speedscope"""
+
+    def __init__(self, output_dir, token="", sample_rate=0.0, interval=0.001, max_concurrent=4,
+                 keep_files=200, top=15, load_settings=None, reload_seconds=5):
+        self.output_dir = output_dir
+        self.token = token
+        self.sample_rate = sample_rate
+        self.max_concurrent = max_concurrent
+        self.keep_files = keep_files
+        self.top = top
+        self.load_settings = load_settings
+        self.reload_seconds = reload_seconds
+        self.sampler = Sampler(interval)
+        self.routes = {}
+        self._active = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._next_reload = 0.0
+
+    def wants(self, environ):
+        """נקרא בכל בקשה - חייב להיות זול כשהפרופיילינג כבוי"""
+        if self.load_settings is not None:
+            now = monotonic()
+            if now >= self._next_reload:
+                self._next_reload = now + self.reload_seconds
+                self.sample_rate = float(self.load_settings().get("sample_rate", 0))
+        header = environ.get("HTTP_X_PROFILE")
+        if header is not None:
+            return bool(self.token) and hmac.compare_digest(header, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def begin(self, name, stop_code):
+        with self._lock:
+            if self._active >= self.max_concurrent:
+                return None
+            self._active += 1
+            self._seq += 1
+            seq = self._seq
+        session = ProfileSession(name, f"{strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{seq:06d}.speedscope.json", stop_code)
+        self.sampler.add(session)
+        return session
+
+    def end(self, session, route):
+        self.sampler.remove(session)
+        session.finish()
+        with self._lock:
+            self._active -= 1
+            self._aggregate(route, session)
+        self._dump(session)
+
+    def _aggregate(self, route, session):
+        stats = self.routes.setdefault(route, {"requests": 0, "total_ms": 0.0,
+                                               "self_ms": Counter(), "inclusive_ms": Counter()})
+        stats["requests"] += 1
+        stats["total_ms"] += session.elapsed
+        labels = [frame_label(frame) for frame in session.frames]
+        for stack, weight in zip(session.samples, session.weights):
+            if stack:
+                stats["self_ms"][labels[stack[-1]]] += weight
+            for index in set(stack):
+                stats["inclusive_ms"][labels[index]] += weight
+
+    def _dump(self, session):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(os.path.join(self.output_dir, session.filename), "w", encoding="utf-8") as f:
+                json.dump(session.speedscope(), f)
+            files = sorted(name for name in os.listdir(self.output_dir) if name.endswith(".speedscope.json"))
+            for name in files[:-self.keep_files]:
+                os.remove(os.path.join(self.output_dir, name))
+        except OSError as e:
+            print("Profile dump failed:", e)
+
+    def summary(self):
+        with self._lock:
+            return {
+                route: {
+                    "requests": stats["requests"],
+                    "avg_ms": round(stats["total_ms"] / stats["requests"], 2),
+                    "top_self": [{"function": name, "ms": round(ms, 2)}
+                                 for name, ms in stats["self_ms"].most_common(self.top)],
+                    "top_inclusive": [{"function": name, "ms": round(ms, 2)}
+                                      for name, ms in stats["inclusive_ms"].most_common(self.top)],
+                }
+                for route, stats in self.routes.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self.routes.clear()
+
+
+class ProfilingMiddleware:
+    """עוטף את ה-WSGI app כך שגם פענוח הבקשה, ה-hooks והדחיסה נכנסים לפרופיל.
+    תגובה בזרימה (SSE, ייצוא) נמדדת עד החזרת ה-iterable בלבד"""
+
+    def __init__(self, app, profiler, route_of):
+        self.app = app
+        self.profiler = profiler
+        self.route_of = route_of
+
+    def __call__(self, environ, start_response):
+        if not self.profiler.wants(environ):
+            return self.app(environ, start_response)
+
+        route = self.route_of(environ)
+        session = self.profiler.begin(route, ProfilingMiddleware.__call__.__code__)
+        if session is None:
+            return self.app(environ, start_response)
+
+        def start_profiled_response(status, headers, exc_info=None):
+            headers.append(("X-Profile-File", session.filename))
+            return start_response(status, headers, exc_info)
+
+        try:
+            return self.app(environ, start_profiled_response)
+        finally:
+            self.profiler.end(session, route)
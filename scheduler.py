@@ -0,0 +1,188 @@
+# מתזמן משימות רקע בתוך התהליך (threads), עם מצב נשמר בקובץ JSON מקומי.
+# משימה exclusive רצה בתהליך אחד בלבד גם כשיש כמה workers (נעילת קובץ),
+# ומשימה רגילה רצה בכל תהליך (למשל חימום מטמון שהוא מקומי לכל worker).
+# כשרצים על כמה שרתים מעבירים lock של האחסון המשותף, והמשימה רצה פעם אחת בכל האשכול.
+import fcntl
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import monotonic, sleep
+
+
+class SystemClock:
+    def now(self):
+        return datetime.now()
+
+    def sleep(self, seconds):
+        sleep(seconds)
+
+
+class FakeClock:
+    """שעון לבדיקות: הזמן מתקדם רק דרך advance()"""
+
+    def __init__(self, start):
+        self.current = start
+
+    def now(self):
+        return self.current
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds=0, **kwargs):
+        self.current += timedelta(seconds=seconds, **kwargs)
+
+
+@contextmanager
+def flock(name, blocking=True):
+    with open(name + ".lock", "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def every(seconds):
+    return lambda after: after + timedelta(seconds=seconds)
+
+
+def daily(at):
+    hour, minute = (int(x) for x in at.split(":"))
+
+    def next_run(after):
+        candidate = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= after:
+            candidate += timedelta(days=1)
+        return candidate
+
+    return next_run
+
+
+class Job:
+    def __init__(self, name, func, schedule, exclusive):
+        self.name = name
+        self.func = func
+        self.schedule = schedule
+        self.exclusive = exclusive
+        self.stats = {"next_run": None, "last_run": None, "last_duration_ms": None,
+                      "runs": 0, "failures": 0, "last_error": None}
+
+
+class Scheduler:
+    """כל משימה מקבלת את now של השעון - עם FakeClock קוראים ל-run_pending(wait=True) ישירות"""
+
+    def __init__(self, state_file, load, save, clock=None, max_workers=2, tick_seconds=30, lock=flock):
+        self.state_file = state_file
+        self.load = load
+        self.save = save
+        self.lock = lock
+        self.clock = clock or SystemClock()
+        self.max_workers = max_workers
+        self.tick_seconds = tick_seconds
+        self.jobs = {}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def add_job(self, name, func, schedule, exclusive=False):
+        job = Job(name, func, schedule, exclusive)
+        persisted = self.load(self.state_file).get(name) if exclusive else None
+        if persisted and persisted.get("next_run"):
+            # ריצה שהוחמצה בזמן שהשרת היה למטה תרוץ פעם אחת מיד
+            job.stats.update(persisted)
+        else:
+            job.stats["next_run"] = job.schedule(self.clock.now()).isoformat()
+        self.jobs[name] = job
+        return job
+
+    def due_jobs(self):
+        now = self.clock.now().isoformat()
+        with self._lock:
+            return [job for job in self.jobs.values()
+                    if job.name not in self._running and job.stats["next_run"] <= now]
+
+    def run_pending(self, wait=False):
+        """מגיש לביצוע את כל המשימות שהגיע זמנן (עד max_workers במקביל)"""
+        if self._stop.is_set():
+            return []
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="scheduler")
+        futures = []
+        for job in self.due_jobs():
+            with self._lock:
+                self._running.add(job.name)
+            futures.append(self._executor.submit(self._run, job))
+        if wait:
+            for future in futures:
+                future.result()
+        return futures
+
+    def _run(self, job):
+        try:
+            if job.exclusive:
+                self._run_exclusive(job)
+            else:
+                self._execute(job)
+        finally:
+            with self._lock:
+                self._running.discard(job.name)
+
+    def _run_exclusive(self, job):
+        with self.lock(self.state_file, blocking=False) as acquired:
+            if not acquired:
+                return  # תהליך אחר מריץ את המשימה כרגע
+            state = self.load(self.state_file)
+            persisted = state.get(job.name)
+            if persisted and persisted.get("next_run", "") > self.clock.now().isoformat():
+                job.stats.update(persisted)  # כבר רצה בתהליך אחר
+                return
+            self._execute(job)
+            state = self.load(self.state_file)
+            state[job.name] = job.stats
+            self.save(self.state_file, state)
+
+    def _execute(self, job):
+        started_at = self.clock.now()
+        start = monotonic()
+        try:
+            job.func(started_at)
+            job.stats["last_error"] = None
+        except Exception as e:
+            job.stats["failures"] += 1
+            job.stats["last_error"] = str(e)
+            print(f"Scheduled job '{job.name}' failed:", e)
+        job.stats["runs"] += 1
+        job.stats["last_run"] = started_at.isoformat()
+        job.stats["last_duration_ms"] = round((monotonic() - start) * 1000, 2)
+        job.stats["next_run"] = job.schedule(self.clock.now()).isoformat()
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(job.stats, running=name in self._running, exclusive=job.exclusive)
+                    for name, job in self.jobs.items()}
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.run_pending()
+            self._stop.wait(self.tick_seconds)
+
+    def stop(self, wait=True):
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
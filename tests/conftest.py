@@ -0,0 +1,101 @@
+# app.py עובד מול קבצים בתיקיית העבודה ופותח את האחסון בזמן import - מריצים את הבדיקות
+# מתיקייה זמנית, עם קבצים מקומיים ובלי מתזמן רקע, כדי לא לגעת בנתונים האמיתיים.
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from time import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ["STORAGE_URL"] = ""
+os.environ["SCHEDULER_ENABLED"] = "0"
+os.chdir(tempfile.mkdtemp(prefix="barber_tests_"))
+
+# תהליך "שרת": מריץ את האפליקציה מול STORAGE_URL ומדפיס את קודי ה-HTTP של הבקשות שלו
+NODE_SCRIPT = """
+import json, sys
+from datetime import date
+from time import sleep, time
+import app
+
+app.send_email = lambda *args: None
+client = app.app.test_client()
+today = date.today().isoformat()
+action, start_at, times = sys.argv[1], float(sys.argv[2]), json.loads(sys.argv[3])
+
+if action == "setup":
+    app.save_json(app.APPOINTMENTS_FILE, {})
+    app.save_json(app.OVERRIDES_FILE, {})
+    app.save_weekly_schedule({str(date.today().weekday()): times})
+    sys.exit(0)
+
+sleep(max(0, start_at - time()))  # כל התהליכים מתחילים יחד
+results = []
+for slot in times:
+    if action == "book":
+        response = client.post("/book", json={"name": sys.argv[4], "phone": "1", "date": today,
+                                              "time": slot, "service": "Color"})
+    elif action == "cancel":
+        response = client.post("/cancel_appointment", json={"name": sys.argv[4], "phone": "1",
+                                                            "date": today, "time": slot})
+    else:
+        response = client.post("/hold", json={"date": today, "time": slot})
+    results.append(response.status_code)
+print(json.dumps(results))
+"""
+
+
+@pytest.fixture
+def run_nodes(tmp_path):
+    script = tmp_path / "node.py"
+    script.write_text(NODE_SCRIPT, encoding="utf-8")
+
+    def run(storage_url, *commands, workdir=None):
+        """מריץ את הפקודות במקביל, כל אחת בתהליך ובתיקייה משלה; מחזיר את קודי ה-HTTP של כל אחת"""
+        env = dict(os.environ, STORAGE_URL=storage_url, SCHEDULER_ENABLED="0",
+                   PYTHONPATH=os.pathsep.join([ROOT, os.environ.get("PYTHONPATH", "")]))
+        start_at = time() + 1.5
+        processes = []
+        for i, (action, times, *extra) in enumerate(commands):
+            cwd = workdir or tmp_path / f"node{i}"
+            os.makedirs(cwd, exist_ok=True)
+            processes.append(subprocess.Popen(
+                [sys.executable, str(script), action, str(start_at), json.dumps(times), *extra],
+                cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True))
+        outputs = []
+        for process in processes:
+            stdout, stderr = process.communicate(timeout=120)
+            assert process.returncode == 0, stderr
+            outputs.append(json.loads(stdout.strip().splitlines()[-1]) if stdout.strip() else None)
+        return outputs
+
+    return run
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    """האפליקציה בתוך התהליך, מול תיקייה ריקה משלה (האחסון המקומי יחסי לתיקיית העבודה)"""
+    import app
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(app, "send_email", lambda *args: None)
+    app._read_cache.clear()
+    app._page_cache.clear()
+    return app
+
+
+@pytest.fixture
+def today_slots(app_module):
+    """שגרה שבועית עם השעות של היום, תורים ו-overrides ריקים; מחזיר (תאריך, שעות)"""
+    from datetime import date
+
+    slots = ["09:00", "09:30", "10:00"]
+    app_module.save_json(app_module.APPOINTMENTS_FILE, {})
+    app_module.save_json(app_module.OVERRIDES_FILE, {})
+    app_module.save_weekly_schedule({str(date.today().weekday()): slots})
+    return date.today().isoformat(), slots
@@ -0,0 +1,107 @@
+# ייבוא/ייצוא בכמות (CSV / JSONL)
+import io
+import json
+
+import pytest
+
+
+@pytest.fixture
+def admin(app_module):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["is_admin"] = True
+    return client
+
+
+def appointment_line(date, time, name="a", **extra):
+    return json.dumps(dict({"date": date, "time": time, "name": name, "phone": "1", "service": "Color"},
+                           **extra)) + "\n"
+
+
+def test_urlencoded_body_is_rejected(admin):
+    # ברירת המחדל של curl --data: פענוח הטופס היה בולע את הגוף ומחזיר 0 שורות בלי שגיאה
+    response = admin.post("/admin/import/weekly_schedule", data="day_key,time\n1,09:00\n",
+                          content_type="application/x-www-form-urlencoded")
+    assert response.status_code == 415
+
+
+def test_body_and_multipart_upload_are_imported(app_module, admin):
+    body = admin.post("/admin/import/weekly_schedule", data="day_key,time\n1,09:00\n", content_type="text/csv")
+    upload = admin.post("/admin/import/weekly_schedule",
+                        data={"file": (io.BytesIO(b"day_key,time\n2,10:00\n"), "weekly.csv")})
+
+    assert body.get_json()["imported"] == upload.get_json()["imported"] == 1
+    assert app_module.load_weekly_schedule() == {"1": ["09:00"], "2": ["10:00"]}
+
+
+def test_overflowing_price_is_a_row_error(app_module, admin):
+    lines = '{"date": "2030-01-01", "time": "09:00", "name": "a", "phone": "1", "service": "Color", "price": 1e400}\n'
+    lines += appointment_line("2030-01-01", "09:30", price="-5")
+    lines += appointment_line("2030-01-01", "10:00", price="80")
+
+    response = admin.post("/admin/import/appointments?format=jsonl", data=lines,
+                          content_type="application/x-ndjson")
+
+    result = response.get_json()
+    assert response.status_code == 200
+    assert (result["imported"], [e["line"] for e in result["errors"]]) == (1, [1, 2])
+    assert [a["price"] for a in app_module.load_appointments()["2030-01-01"]] == [80]
+
+
+def test_booking_between_batches_is_kept(app_module, today_slots, monkeypatch):
+    monkeypatch.setattr(app_module, "IMPORT_BATCH_SIZE", 2)
+    date, slots = today_slots
+    client = app_module.app.test_client()
+
+    def rows():
+        yield appointment_line("2030-01-01", "09:00")
+        yield appointment_line("2030-01-01", "09:30")
+        # המנה הראשונה נשמרה - לקוח מזמין לפני שהמנה הבאה נקראת
+        assert client.post("/book", json={"name": "b", "phone": "2", "date": date, "time": slots[0],
+                                          "service": "Color"}).status_code == 200
+        yield appointment_line("2030-01-01", "10:00")
+
+    result = app_module.import_rows("appointments", rows(), "jsonl")
+
+    appointments = app_module.load_appointments()
+    assert result["imported"] == 3
+    assert [a["name"] for a in appointments[date]] == ["b"]
+    assert len(appointments["2030-01-01"]) == 3
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_export_import_round_trip(app_module, fmt):
+    appointments = {"2030-01-01": [
+        {"name": "=HYPERLINK(\"http://x\")", "phone": "+972501234567", "time": "09:00", "service": "Color",
+         "price": 250, "staff": "main"},
+        {"name": "דנה", "phone": "050-1", "time": "09:30", "service": "Blow Dry", "price": 70, "staff": "main"},
+    ]}
+    overrides = {"2030-01-01": {"add": ["11:00"], "remove": ["09:00"]},
+                 "2030-01-02": {"add": [], "remove": ["__all__"]}}
+    weekly = {"1": ["09:00", "09:30"], "4": ["12:00"]}
+    app_module.save_appointments(appointments)
+    app_module.save_overrides(overrides)
+    app_module.save_weekly_schedule(weekly)
+
+    exported = {kind: "".join(app_module.export_lines(kind, fmt)) for kind in app_module.BULK_KINDS}
+    app_module.save_appointments({})
+    app_module.save_overrides({})
+    app_module.save_weekly_schedule({})
+    for kind, text in exported.items():
+        result = app_module.import_rows(kind, io.StringIO(text, newline=""), fmt)
+        assert result["error_count"] == 0, result["errors"]
+
+    assert app_module.load_appointments() == appointments
+    assert app_module.load_overrides() == overrides
+    assert app_module.load_weekly_schedule() == weekly
+
+
+def test_csv_export_escapes_formulas(app_module):
+    app_module.save_appointments({"2030-01-01": [
+        {"name": "=HYPERLINK(\"http://x\")", "phone": "@1", "time": "09:00", "service": "Color", "price": 250}]})
+
+    text = "".join(app_module.export_lines("appointments", "csv"))
+
+    row = text.splitlines()[1]
+    assert "'=HYPERLINK" in row and ",'@1," in row
+    assert "".join(app_module.export_lines("appointments", "jsonl")).count("'") == 0
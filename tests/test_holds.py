@@ -0,0 +1,87 @@
+# החזקות זמניות של שעות: משותפות לכל ה-workers דרך האחסון
+import json
+
+import pytest
+
+
+@pytest.mark.parametrize("backend", ["files", "sqlite"])
+def test_holds_are_shared_between_processes(tmp_path, run_nodes, backend):
+    url = f"sqlite:///{tmp_path / 'shared.db'}" if backend == "sqlite" else ""
+    workdir = tmp_path / "data"  # קבצים מקומיים: כמה workers באותה תיקייה
+    run_nodes(url, ("setup", ["09:00"]), workdir=workdir)
+
+    first, second = run_nodes(url, ("hold", ["09:00"]), ("hold", ["09:00"]), workdir=workdir)
+
+    assert sorted(first + second) == [200, 400]
+
+
+@pytest.fixture
+def clock(app_module, monkeypatch):
+    """שעון ההחזקות - מתקדם רק ידנית"""
+    now = [1_000_000.0]
+    monkeypatch.setattr(app_module.slot_holds, "clock", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def render_slots(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "render_template",
+                        lambda name, week_slots, **context: json.dumps(week_slots, sort_keys=True))
+
+
+def test_expired_hold_changes_the_page_etag(app_module, today_slots, clock, render_slots):
+    date, slots = today_slots
+    app_module.app.test_client().post("/hold", json={"date": date, "time": slots[0]})
+    client = app_module.app.test_client()
+    held = client.get("/")
+    assert slots[0] not in held.get_data(as_text=True)
+
+    clock[0] += app_module.HOLD_TTL_SECONDS + 1
+    response = client.get("/", headers={"If-None-Match": held.headers["ETag"]})
+
+    assert response.status_code == 200
+    assert slots[0] in response.get_data(as_text=True)
+
+
+def test_expired_hold_sends_a_snapshot_to_live_clients(app_module, today_slots, clock, monkeypatch):
+    monkeypatch.setattr(app_module, "SSE_POLL_SECONDS", 0.05)
+    date, slots = today_slots
+    app_module.app.test_client().post("/hold", json={"date": date, "time": slots[0]})
+    stream = app_module.app.test_client().get("/availability/stream", buffered=False)
+    events = (chunk.decode("utf-8") for chunk in stream.response)
+    assert slots[0] not in next(events)
+
+    clock[0] += app_module.HOLD_TTL_SECONDS + 1
+    event = next(events)
+
+    assert event.startswith("event: snapshot")
+    assert slots[0] in json.loads(event.split("data: ", 1)[1])["dates"][date]
+
+
+def test_holds_are_limited_per_client_address(app_module, today_slots, clock, monkeypatch):
+    monkeypatch.setattr(app_module, "HOLD_MAX_PER_CLIENT", 2)
+    date, slots = today_slots
+
+    def hold(time, address="10.0.0.1"):
+        # בלי cookie - כל בקשה מקבלת session חדש, כמו סקריפט
+        client = app_module.app.test_client()
+        return client.post("/hold", json={"date": date, "time": time},
+                           environ_base={"REMOTE_ADDR": address}).status_code
+
+    assert [hold(slots[0]), hold(slots[1]), hold(slots[2])] == [200, 200, 429]
+    assert hold(slots[2], address="10.0.0.2") == 200
+
+    clock[0] += app_module.HOLD_TTL_SECONDS + 1
+    assert hold(slots[0]) == 200
+
+
+def test_holder_still_sees_their_own_slot(app_module, today_slots):
+    date, slots = today_slots
+    holder, other = app_module.app.test_client(), app_module.app.test_client()
+    holder.post("/hold", json={"date": date, "time": slots[0]})
+
+    def free_times(client):
+        return [t["time"] for t in client.get("/availability").get_json()[date]["times"]]
+
+    assert free_times(holder) == slots
+    assert free_times(other) == slots[1:]
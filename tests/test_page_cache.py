@@ -0,0 +1,35 @@
+# מטמון הדף הציבורי ו-ETag
+import json
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def render_slots(app_module, monkeypatch):
+    # index.html לא חלק מהמאגר - הדף בבדיקות הוא השעות הפנויות עצמן
+    monkeypatch.setattr(app_module, "render_template",
+                        lambda name, week_slots, **context: json.dumps(week_slots, sort_keys=True))
+
+
+def test_etag_does_not_depend_on_the_worker(app_module, today_slots):
+    client = app_module.app.test_client()
+    etag = client.get("/").headers["ETag"]
+
+    # worker אחר: אותו תוכן, מונה מקומי אחר
+    app_module.bump_availability_version()
+    response = client.get("/", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_etag_changes_after_a_booking(app_module, today_slots):
+    date, slots = today_slots
+    client = app_module.app.test_client()
+    etag = client.get("/").headers["ETag"]
+
+    client.post("/book", json={"name": "a", "phone": "1", "date": date, "time": slots[0], "service": "Color"})
+    response = client.get("/", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
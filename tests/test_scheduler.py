@@ -0,0 +1,142 @@
+import copy
+from datetime import datetime
+
+import pytest
+
+from scheduler import FakeClock, Scheduler, daily, every, flock
+
+START = datetime(2026, 1, 5, 2, 0)
+
+
+class MemoryState:
+    """load/save של קובץ המצב בזיכרון - כמו load_json/save_json"""
+
+    def __init__(self):
+        self.files = {}
+
+    def load(self, name):
+        return copy.deepcopy(self.files.get(name, {}))
+
+    def save(self, name, data):
+        self.files[name] = copy.deepcopy(data)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock(START)
+
+
+@pytest.fixture
+def state():
+    return MemoryState()
+
+
+@pytest.fixture
+def make_scheduler(tmp_path, clock, state):
+    schedulers = []
+
+    def make():
+        scheduler = Scheduler(str(tmp_path / "scheduler_state.json"), state.load, state.save, clock=clock)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.stop()
+
+
+def test_run_pending_runs_only_due_jobs(make_scheduler, clock):
+    runs = []
+    scheduler = make_scheduler()
+    scheduler.add_job("tick", runs.append, every(60))
+
+    assert scheduler.run_pending(wait=True) == []
+    clock.advance(59)
+    scheduler.run_pending(wait=True)
+    assert runs == []
+
+    clock.advance(1)
+    scheduler.run_pending(wait=True)
+    scheduler.run_pending(wait=True)
+    assert runs == [datetime(2026, 1, 5, 2, 1)]
+    stats = scheduler.stats()["tick"]
+    assert stats["runs"] == 1
+    assert stats["next_run"] == "2026-01-05T02:02:00"
+
+
+def test_daily_job_runs_at_its_time(make_scheduler, clock):
+    runs = []
+    scheduler = make_scheduler()
+    scheduler.add_job("archive", runs.append, daily("03:00"))
+
+    clock.advance(minutes=59)
+    scheduler.run_pending(wait=True)
+    assert runs == []
+
+    clock.advance(minutes=1)
+    scheduler.run_pending(wait=True)
+    assert runs == [datetime(2026, 1, 5, 3, 0)]
+    assert scheduler.stats()["archive"]["next_run"] == "2026-01-06T03:00:00"
+
+
+def test_failing_job_is_recorded_and_rescheduled(make_scheduler, clock):
+    def fail(now):
+        raise RuntimeError("boom")
+
+    scheduler = make_scheduler()
+    scheduler.add_job("broken", fail, every(60))
+    clock.advance(60)
+    scheduler.run_pending(wait=True)
+
+    stats = scheduler.stats()["broken"]
+    assert (stats["runs"], stats["failures"], stats["last_error"]) == (1, 1, "boom")
+    assert stats["next_run"] == "2026-01-05T02:02:00"
+
+
+def test_exclusive_job_is_skipped_while_another_process_holds_the_lock(make_scheduler, clock):
+    runs = []
+    scheduler = make_scheduler()
+    scheduler.add_job("reminders", runs.append, every(60), exclusive=True)
+    clock.advance(60)
+
+    # flock נפרד לכל open() - כמו worker אחר שמריץ את המשימה כרגע
+    with flock(scheduler.state_file) as acquired:
+        assert acquired
+        scheduler.run_pending(wait=True)
+    assert runs == []
+
+    scheduler.run_pending(wait=True)
+    assert len(runs) == 1
+
+
+def test_exclusive_job_runs_once_across_schedulers(make_scheduler, clock, state):
+    runs = []
+    first, second = make_scheduler(), make_scheduler()
+    first.add_job("reminders", lambda now: runs.append("first"), every(60), exclusive=True)
+    second.add_job("reminders", lambda now: runs.append("second"), every(60), exclusive=True)
+    clock.advance(60)
+
+    first.run_pending(wait=True)
+    second.run_pending(wait=True)
+
+    assert runs == ["first"]
+    assert second.stats()["reminders"]["next_run"] == "2026-01-05T02:02:00"
+    assert state.load(first.state_file)["reminders"]["runs"] == 1
+
+
+def test_missed_exclusive_run_catches_up_after_restart(make_scheduler, clock):
+    runs = []
+    first = make_scheduler()
+    first.add_job("archive", runs.append, daily("03:00"), exclusive=True)
+    clock.advance(hours=1)
+    first.run_pending(wait=True)
+    assert len(runs) == 1
+
+    # השרת היה למטה ב-03:00 של היום הבא: הריצה שהוחמצה רצה פעם אחת מיד אחרי העלייה
+    clock.advance(days=1, hours=5)
+    restarted = make_scheduler()
+    restarted.add_job("archive", runs.append, daily("03:00"), exclusive=True)
+    restarted.run_pending(wait=True)
+    restarted.run_pending(wait=True)
+    assert len(runs) == 2
+    assert restarted.stats()["archive"]["next_run"] == "2026-01-07T03:00:00"
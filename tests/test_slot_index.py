@@ -0,0 +1,72 @@
+# השוואה אקראית של מנוע הזמינות (מסכות ביטים) מול המימוש הקודם על מחרוזות
+import random
+
+import pytest
+
+from app import DEFAULT_STAFF_ID, MINUTE_LABELS, combine_staff_slots, index_day_slots, times_to_mask
+
+CASES = 20000
+GRID = [f"{h:02d}:{m:02d}" for h in range(8, 20) for m in range(0, 60, 15)]
+
+
+def reference_day_slots(scheduled, override, booked_times, held_times=()):
+    """המימוש על מחרוזות מלפני המסכות: {"HH:MM": (available, source)}"""
+    scheduled = set(scheduled)
+    added = set(override.get("add", []))
+    removed = set(override.get("remove", []))
+    booked_times = set(booked_times)
+    disabled_day = "__all__" in removed
+    edited_to = {e["to"] for e in override.get("edit", [])}
+    edited_from = {e["from"] for e in override.get("edit", [])} - edited_to
+
+    day_index = {}
+    for t in scheduled | added | edited_to:
+        if t in edited_from:
+            continue
+        if t in booked_times:
+            day_index[t] = (False, "booked")
+        elif t in edited_to:
+            day_index[t] = (True, "edited")
+        else:
+            available = not (disabled_day or t in removed)
+            if t in added and t not in scheduled:
+                source = "added"
+            elif not available:
+                source = "disabled"
+            else:
+                source = "base"
+            day_index[t] = (available, source)
+    for t in held_times:
+        if day_index.get(t, (False,))[0]:
+            day_index[t] = (False, "held")
+    return day_index
+
+
+def random_times(rng, k):
+    return rng.sample(GRID, rng.randint(0, k))
+
+
+def random_override(rng):
+    override = {"add": random_times(rng, 6), "remove": random_times(rng, 6)}
+    if rng.random() < 0.05:
+        override["remove"].append("__all__")
+    if rng.random() < 0.4:
+        override["edit"] = [{"from": rng.choice(GRID), "to": rng.choice(GRID)} for _ in range(rng.randint(1, 3))]
+    return override
+
+
+def as_index(day):
+    return {MINUTE_LABELS[m]: (day.is_available(m), day.source(m)) for m in day}
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_single_staff_matches_reference(seed):
+    rng = random.Random(seed)
+    for _ in range(CASES // 4):
+        scheduled, override = random_times(rng, 30), random_override(rng)
+        booked, held = random_times(rng, 8), random_times(rng, 4)
+
+        day = index_day_slots(times_to_mask(scheduled), override, times_to_mask(booked))
+        combined = combine_staff_slots([(DEFAULT_STAFF_ID, day)], {t: 1 for t in held})
+
+        assert as_index(combined) == reference_day_slots(scheduled, override, booked, held)
@@ -0,0 +1,34 @@
+# עדכוני זמינות חיים (SSE): תקרת זרמים לתהליך וסגירה בכיבוי
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+
+@pytest.mark.parametrize("env, expected", [
+    ({"GUNICORN_WORKER_CLASS": "gthread", "GUNICORN_THREADS": "4"}, 2),
+    ({"GUNICORN_WORKER_CLASS": "gthread", "GUNICORN_THREADS": "8", "SSE_MAX_CLIENTS": "50"}, 7),
+    ({"GUNICORN_WORKER_CLASS": "gevent"}, 900),
+])
+def test_stream_cap_follows_the_worker_class(tmp_path, env, expected):
+    output = subprocess.run([sys.executable, "-c", "import app; print(app.SSE_MAX_CLIENTS)"],
+                            cwd=tmp_path, env=dict(os.environ, PYTHONPATH=ROOT, **env),
+                            capture_output=True, text=True, check=True).stdout
+    assert int(output.split()[-1]) == expected
+
+
+def test_streams_over_the_cap_get_503_and_close_on_shutdown(app_module, today_slots, monkeypatch):
+    monkeypatch.setattr(app_module, "SSE_MAX_CLIENTS", 1)
+    client = app_module.app.test_client()
+    stream = client.get("/availability/stream", buffered=False)
+    events = (chunk.decode("utf-8") for chunk in stream.response)
+    assert next(events).startswith("event: snapshot")
+
+    assert client.get("/availability/stream").status_code == 503
+
+    monkeypatch.setattr(app_module, "_shutting_down", False)  # begin_shutdown משנה את הדגל הגלובלי
+    app_module.begin_shutdown()
+    assert list(events) == []
@@ -0,0 +1,50 @@
+# שילוב הזמינות של כמה אנשי צוות, מול זמינות כל אחד מהם לפי המימוש על מחרוזות
+import random
+from datetime import date
+
+from app import combine_staff_slots, index_day_slots, minute_of, times_to_mask
+from test_slot_index import GRID, random_override, random_times, reference_day_slots
+
+
+def test_multi_staff_availability_counts_free_chairs():
+    rng = random.Random(99)
+    for _ in range(2000):
+        staff = []
+        for i in range(rng.randint(2, 4)):
+            scheduled, override, booked = random_times(rng, 30), random_override(rng), random_times(rng, 8)
+            staff.append((f"s{i}", reference_day_slots(scheduled, override, booked),
+                          index_day_slots(times_to_mask(scheduled), override, times_to_mask(booked))))
+        held = {t: rng.randint(1, 3) for t in random_times(rng, 6)}
+
+        day = combine_staff_slots([(sid, slots) for sid, _, slots in staff], held)
+
+        for t in GRID:
+            free = [sid for sid, reference, _ in staff if reference.get(t, (False,))[0]]
+            minute = minute_of(t)
+            assert day.free_staff(minute) == free
+            assert day.is_available(minute) == (len(free) > held.get(t, 0))
+            # all_free: כל הצוות פנוי, והשעה לא מוחזקת במלואה
+            assert bool(day.all_free >> minute & 1) == (len(free) == len(staff) > held.get(t, 0))
+
+
+def test_admin_overrides_shows_the_chosen_staff_member(app_module, today_slots, monkeypatch):
+    day, slots = today_slots
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["is_admin"] = True
+    client.post("/staff", json={"action": "add", "staff_id": "chair2", "name": "B"})
+    app_module.save_weekly_schedule({str(date.today().weekday()): slots[:1]}, "chair2")
+    # השעה הראשונה תפוסה אצל הראשי - בשילוב היא עדיין פנויה (chair2)
+    client.post("/book", json={"name": "a", "phone": "1", "date": day, "time": slots[0], "service": "Color"})
+
+    rendered = {}
+    monkeypatch.setattr(app_module, "render_template", lambda name, **context: rendered.update(context) or "")
+    client.get("/admin_overrides?staff_id=main")
+    main_times = {t["time"]: t for t in rendered["week_slots"][day]["times"]}
+    client.get("/admin_overrides?staff_id=chair2")
+    chair_times = {t["time"]: t for t in rendered["week_slots"][day]["times"]}
+
+    assert (main_times[slots[0]]["available"], main_times[slots[0]]["source"]) == (False, "booked")
+    assert main_times[slots[1]]["free_staff"] == ["main"]
+    assert list(chair_times) == slots[:1]
+    assert chair_times[slots[0]]["free_staff"] == ["chair2"]
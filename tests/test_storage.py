@@ -0,0 +1,123 @@
+# כמה תהליכים מול אותו אחסון (כמו workers של gunicorn או כמה שרתים): כל תהליך מריץ את
+# האפליקציה מתיקייה משלו ומזמין דרך test client, והבדיקה קוראת את התוצאה מהאחסון המשותף.
+import json
+from datetime import date
+from time import sleep
+
+import pytest
+
+from cluster import FileStorage, NamespacedStorage, SQLiteStorage, node_for, parse_nodes
+
+SLOTS = [f"{9 + i // 4:02d}:{(i % 4) * 15:02d}" for i in range(12)]
+LATE_SLOTS = [f"{14 + i // 4:02d}:{(i % 4) * 15:02d}" for i in range(12)]
+
+
+def read_document(storage, name):
+    text = storage.get(name)
+    return json.loads(text) if text else {}
+
+
+def test_two_processes_booking_the_same_slots_on_sqlite(tmp_path, run_nodes):
+    url = f"sqlite:///{tmp_path / 'shared.db'}"
+    run_nodes(url, ("setup", SLOTS))
+
+    first, second = run_nodes(url, ("book", SLOTS, "a"), ("book", SLOTS, "b"))
+
+    storage = SQLiteStorage(str(tmp_path / "shared.db"))
+    appointments = read_document(storage, "appointments.json")[date.today().isoformat()]
+    assert sorted(appt["time"] for appt in appointments) == SLOTS
+    assert first.count(200) + second.count(200) == len(SLOTS)
+    assert storage._db().execute("SELECT count(*) FROM locks").fetchone()[0] == 0
+
+
+def test_cancel_does_not_overwrite_a_concurrent_booking(tmp_path, run_nodes):
+    url = f"sqlite:///{tmp_path / 'shared.db'}"
+    run_nodes(url, ("setup", SLOTS + LATE_SLOTS))
+    run_nodes(url, ("book", LATE_SLOTS, "old"))
+
+    booked, canceled = run_nodes(url, ("book", SLOTS, "new"), ("cancel", LATE_SLOTS, "old"))
+
+    assert booked == [200] * len(SLOTS) and canceled == [200] * len(LATE_SLOTS)
+    storage = SQLiteStorage(str(tmp_path / "shared.db"))
+    today = date.today().isoformat()
+    appointments = read_document(storage, "appointments.json")[today]
+    assert sorted(appt["time"] for appt in appointments) == SLOTS
+    day = read_document(storage, "overrides.json")[today]
+    assert sorted(entry["time"] for entry in day["booked"] if entry["name"] == "new") == SLOTS
+    assert sorted(day["remove"]) == SLOTS
+
+
+def test_shared_lock_is_renewed_past_its_ttl(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "locks.db"))
+    with storage.lock("job", ttl=0.3) as acquired:
+        assert acquired
+        sleep(1)
+        assert not storage._try_lock("job", "other", 0.3)
+    assert storage._try_lock("job", "other", 0.3)
+
+
+def test_redis_lock_is_renewed_past_its_ttl():
+    fakeredis = pytest.importorskip("fakeredis")
+    from cluster import RedisStorage
+
+    storage = RedisStorage(fakeredis.FakeRedis())
+    with storage.lock("job", ttl=0.3):
+        sleep(1)
+        assert not storage._try_lock("job", "other", 0.3)
+    assert storage._try_lock("job", "other", 0.3)
+
+
+def test_businesses_on_one_storage_do_not_share_slots(tmp_path, run_nodes, monkeypatch):
+    url = f"sqlite:///{tmp_path / 'shared.db'}"
+    for code in ("north", "south"):
+        monkeypatch.setenv("BUSINESS_CODE", code)
+        run_nodes(url, ("setup", SLOTS))
+
+    monkeypatch.setenv("BUSINESS_CODE", "north")
+    north = run_nodes(url, ("book", SLOTS, "a"))
+    monkeypatch.setenv("BUSINESS_CODE", "south")
+    south = run_nodes(url, ("book", SLOTS, "b"))
+
+    assert north == south == [[200] * len(SLOTS)]
+    storage = SQLiteStorage(str(tmp_path / "shared.db"))
+    today = date.today().isoformat()
+    for code, name in (("north", "a"), ("south", "b")):
+        appointments = read_document(storage, f"{code}/appointments.json")[today]
+        assert {appt["name"] for appt in appointments} == {name}
+    assert storage.get("appointments.json") is None
+
+
+def test_namespaced_sync_reports_only_its_own_documents(tmp_path):
+    shared = SQLiteStorage(str(tmp_path / "shared.db"))
+    north, south = NamespacedStorage(shared, "north"), NamespacedStorage(shared, "south")
+    north.sync()
+
+    south.put("overrides.json", "{}")
+    north.put("overrides.json", "{}")
+
+    assert north.sync() == ["overrides.json"]
+    assert north.version("overrides.json") != south.version("overrides.json")
+
+
+def test_file_storage_namespace_locks(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = NamespacedStorage(FileStorage(), "north")
+    with storage.lock("booking") as acquired:
+        assert acquired
+        with storage.lock("booking", blocking=False) as again:
+            assert not again
+    storage.put("appointments.json", "{}")
+    assert (tmp_path / "north" / "appointments.json").read_text() == "{}"
+
+
+def test_adding_a_node_moves_only_its_businesses():
+    codes = [f"shop{i}" for i in range(500)]
+    before = {code: node_for(code, ["a", "b", "c"]) for code in codes}
+    after = {code: node_for(code, ["a", "b", "c", "d"]) for code in codes}
+
+    moved = [code for code in codes if before[code] != after[code]]
+    assert all(after[code] == "d" for code in moved)
+    assert 50 < len(moved) < 200
+    assert set(before.values()) == {"a", "b", "c"}
+    assert parse_nodes(" a=http://10.0.0.1:3000/, b=http://10.0.0.2:3000") == {
+        "a": "http://10.0.0.1:3000", "b": "http://10.0.0.2:3000"}
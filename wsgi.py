@@ -0,0 +1,4 @@
+# נקודת כניסה לפרודקשן: gunicorn -c gunicorn.conf.py
+from app import create_app
+
+app = create_app()